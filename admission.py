@@ -0,0 +1,66 @@
+"""
+Admission control for the API.
+
+Each endpoint group has a Gate: at most `concurrency` requests run at once,
+at most `queue_size` more wait for a slot, and none waits longer than
+`max_wait` seconds. Anything beyond that is turned away immediately, so a
+spike degrades into fast 429/503 responses with Retry-After instead of an
+unbounded pile-up that ends in upstream rate limits failing everything.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+import metrics
+
+
+class Gate:
+    def __init__(self, name, concurrency, queue_size, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.retry_after = str(max(1, math.ceil(max_wait)))
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _reject(self, status_code, reason, detail):
+        metrics.admission_rejected.inc(endpoint=self.name, reason=reason)
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": self.retry_after},
+        )
+
+    async def acquire(self):
+        """Waits for a slot; raises 429 if the queue is full, 503 on timeout."""
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            self._reject(429, "queue_full", "Too many requests, try again later")
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject(503, "queue_timeout", "Server busy, try again later")
+        finally:
+            self.waiting -= 1
+            metrics.queue_seconds.observe(
+                time.perf_counter() - start, endpoint=self.name
+            )
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,289 @@
+"""
+Deterministic local stand-ins for every external service the project calls.
+
+Each fake is a small threaded HTTP server speaking just enough of the real
+wire format for the code in this repo:
+
+  FakeCohere    POST /v1/embed, /v2/embed (hashed bag-of-words vectors) and
+                POST /v1/chat (prize classification)
+  FakeOpenAI    POST /v1/chat/completions, with n choices and token usage
+  FakeDevpost   project pages at /software/<slug> and a paginated
+                /project-gallery, in the markup the scrapers parse
+  FakeRanker    POST /similarity, the fine-tuned ranking server on :8001
+
+All of them take a fixed `latency` (seconds) added to every response so
+benchmarks can model slow upstreams. Outputs depend only on the input, so
+runs are repeatable.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+EMBEDDING_DIM = 1024
+
+WORDS = (
+    "ai health climate finance education music game social robot drone "
+    "vision speech blockchain map food travel safety accessibility chat "
+    "sensor energy waste water farm market learning memory sleep fitness"
+).split()
+TECH = (
+    "react python flask fastapi mongodb openai cohere arduino unity firebase "
+    "swift rust tensorflow aws"
+).split()
+AWARDS = [
+    "1st Place Overall",
+    "2nd Place",
+    "Finalist",
+    "Best Use of MongoDB Atlas",
+    "MLH Best Domain Name",
+    "Best Hardware Hack sponsored by Digi-Key",
+]
+
+
+def hash_embedding(text, dim=EMBEDDING_DIM):
+    """Unit-length hashed bag-of-words vector; similar texts get similar vectors."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "little")
+        vector[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def fake_project(i):
+    """A synthetic corpus project shaped like the scraper's output."""
+    rng = np.random.default_rng(i)
+    words = rng.choice(WORDS, size=3, replace=False)
+    built_with = [str(t) for t in rng.choice(TECH, size=3, replace=False)]
+    num_awards = int(rng.integers(0, 3))
+    awards = [str(a) for a in rng.choice(AWARDS, size=num_awards, replace=False)]
+    title = f"{words[0].title()}{words[1].title()} {i}"
+    body = " ".join(rng.choice(WORDS, size=200))
+    return {
+        "title": title,
+        "tagline": f"{words[0]} meets {words[1]} for {words[2]}",
+        "project_url": f"https://devpost.com/software/project-{i}",
+        "thumbnail_url": f"https://example.com/{i}/medium.jpeg",
+        "likes": int(rng.integers(0, 50)),
+        "comments": int(rng.integers(0, 10)),
+        "team_members": [],
+        "is_winner": bool(awards),
+        "parsed_content": {
+            "url": f"https://devpost.com/software/project-{i}",
+            "description_markdown": (
+                f"## Inspiration\n{title} started with {words[0]} and {words[1]}.\n\n"
+                f"## What it does\n{body}\n\n## How we built it\n"
+                + ", ".join(built_with)
+            ),
+            "built_with": built_with,
+            "links": [],
+            "submissions": [
+                {
+                    "name": "Fake Hacks",
+                    "url": "https://fakehacks.devpost.com/",
+                    "awards": awards,
+                }
+            ],
+            "scraped_at": "2024-01-01 00:00:00",
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.fake.latency)
+        self._send(*self.fake.get(urlparse(self.path)))
+
+    def do_POST(self):
+        time.sleep(self.fake.latency)
+        self._send(*self.fake.post(urlparse(self.path).path, self._body()))
+
+
+class FakeServer:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def get(self, url):
+        return 404, {"message": "not found"}
+
+    def post(self, path, body):
+        return 404, {"message": "not found"}
+
+
+class FakeCohere(FakeServer):
+    def post(self, path, body):
+        self.requests += 1
+        if path.endswith("/embed"):
+            vectors = [hash_embedding(t).tolist() for t in body["texts"]]
+            if body.get("embedding_types"):
+                return 200, {
+                    "id": "fake",
+                    "response_type": "embeddings_by_type",
+                    "embeddings": {"float": vectors},
+                    "texts": body["texts"],
+                }
+            return 200, {
+                "id": "fake",
+                "response_type": "embeddings_floats",
+                "embeddings": vectors,
+                "texts": body["texts"],
+            }
+        if path.endswith("/chat"):
+            # Answers one "<n>: <label>" line per numbered prize in the message
+            lines = body.get("message", "").splitlines()
+            answers = []
+            for i, line in enumerate(lines, 1):
+                big = re.search(r"place|finalist|overall", line, re.I)
+                big = big and not re.search(r"mlh|best use", line, re.I)
+                answers.append(f"{i}: {'Big Win' if big else 'Small Win'}")
+            return 200, {
+                "text": "\n".join(answers),
+                "generation_id": "fake",
+                "finish_reason": "COMPLETE",
+            }
+        return super().post(path, body)
+
+
+class FakeOpenAI(FakeServer):
+    def post(self, path, body):
+        self.requests += 1
+        if not path.endswith("/chat/completions"):
+            return super().post(path, body)
+        prompt = body["messages"][-1]["content"]
+        if isinstance(prompt, list):
+            prompt = " ".join(part.get("text", "") for part in prompt)
+        n = body.get("n") or 1
+        seed = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+        choices = [
+            {
+                "index": i,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": f"# **Idea {seed}-{i}**\n\nA **fake** writeup.",
+                },
+            }
+            for i in range(n)
+        ]
+        prompt_tokens = len(prompt) // 4
+        return 200, {
+            "id": f"chatcmpl-{seed}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", "gpt-4o"),
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": 12 * n,
+                "total_tokens": prompt_tokens + 12 * n,
+            },
+        }
+
+
+class FakeDevpost(FakeServer):
+    """Serves project pages and a gallery for a synthetic corpus."""
+
+    def __init__(self, num_projects=200, per_page=24, latency=0.0):
+        super().__init__(latency)
+        self.num_projects = num_projects
+        self.per_page = per_page
+
+    def project_page(self, i):
+        p = fake_project(i)["parsed_content"]
+        paragraphs = "".join(
+            f"<p>{line}</p>" for line in p["description_markdown"].split("\n") if line
+        )
+        tags = "".join(f'<span class="cp-tag">{t}</span>' for t in p["built_with"])
+        winners = "".join(
+            f'<li><span class="winner">Winner</span> {a}</li>'
+            for a in p["submissions"][0]["awards"]
+        )
+        return (
+            "<html><body>"
+            f'<div id="gallery"></div><div>{paragraphs}</div>'
+            f'<div id="built-with">{tags}</div>'
+            '<nav class="app-links">'
+            '<a title="GitHub" href="https://github.com/x/y">Code</a></nav>'
+            '<div id="submissions">'
+            '<a href="https://fakehacks.devpost.com/">Fake Hacks</a>'
+            f"<ul>{winners}</ul></div>"
+            "</body></html>"
+        ).encode()
+
+    def gallery_page(self, page):
+        start = (page - 1) * self.per_page
+        entries = []
+        for i in range(start, min(start + self.per_page, self.num_projects)):
+            p = fake_project(i)
+            entries.append(
+                f'<div class="gallery-item"><a href="{self.url}/software/project-{i}">'
+                f'<div class="software-entry"><h5>{p["title"]}</h5>'
+                f'<p class="small tagline">{p["tagline"]}</p>'
+                f'<img class="software_thumbnail_image" src="{p["thumbnail_url"]}">'
+                '<span data-count="like">3</span><span data-count="comment">1</span>'
+                "</div></a></div>"
+            )
+        info = (
+            f'<span class="items_info">{start + 1} – {start + len(entries)} '
+            f"of {self.num_projects}</span>"
+        )
+        return f"<html><body>{info}{''.join(entries)}</body></html>".encode()
+
+    def get(self, url):
+        self.requests += 1
+        match = re.fullmatch(r"/software/project-(\d+)", url.path)
+        if match:
+            return 200, self.project_page(int(match.group(1))), "text/html"
+        if url.path == "/project-gallery":
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            return 200, self.gallery_page(page), "text/html"
+        return super().get(url)
+
+
+class FakeRanker(FakeServer):
+    def post(self, path, body):
+        self.requests += 1
+        if path != "/similarity":
+            return super().post(path, body)
+        good = [hash_embedding(t) for t in body["good_projects"]]
+        centroid = np.mean(good, axis=0) if good else np.zeros(EMBEDDING_DIM)
+        return 200, [
+            float(hash_embedding(t) @ centroid) for t in body["other_projects"]
+        ]
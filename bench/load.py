@@ -0,0 +1,453 @@
+"""
+Offline benchmark and load test for the API, the scrapers and the triplet
+builders.
+
+Everything external is replaced by the deterministic fakes in bench/fakes.py,
+so runs need no API keys or network and are comparable between commits:
+
+  1. builds a synthetic corpus and index snapshot in a temporary directory
+  2. starts the fakes and a uvicorn server for main:app pointed at them
+  3. drives each endpoint at the requested concurrency and reports
+     p50/p95/p99 latency and throughput
+  4. runs the scrapers and triplet builders against the same fakes
+
+Run from the repository root:
+    python bench/load.py
+    python bench/load.py --projects 5000 --requests 500 --concurrency 32 \\
+        --llm-latency 0.5 --only similar arena
+    python bench/load.py --only similar --llm-latency 2 --flood arena
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import orjson
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from bench import fakes  # noqa: E402
+
+SCENARIOS = [
+    "similar",
+    "similar_link",
+    "similar_batch",
+    "arena",
+    "what-they-did",
+    "how-they-won",
+    "project-insights",
+    "win-score",
+    "scrape_submission",
+    "scrape_gallery",
+    "triplets",
+    "triplets_parallel",
+]
+
+
+def project_id(i):
+    return f"{i:08d}-0000-4000-8000-000000000000"
+
+
+def award_class(project):
+    awards = [a for s in project["parsed_content"]["submissions"] for a in s["awards"]]
+    if any(re.search(r"place|finalist", a, re.I) for a in awards):
+        return "big"
+    return "small" if awards else "none"
+
+
+def build_corpus(workdir, num_projects, backend, chunked=False):
+    """Writes the files build_vector_db.py would produce, for a fake corpus."""
+    import chunking
+    import corpus
+    import mmap_store
+    import similar_to_others
+
+    projects = {}
+    for i in range(num_projects):
+        project = fakes.fake_project(i)
+        project["award"] = award_class(project)
+        projects[project_id(i)] = project
+
+    os.makedirs(os.path.join(workdir, "output"), exist_ok=True)
+    with open(os.path.join(workdir, "output", "project_id_to_data.json"), "wb") as f:
+        f.write(orjson.dumps(projects))
+    corpus_path = os.path.join(workdir, corpus.CORPUS_PATH)
+    with corpus.Writer(corpus_path) as writer:
+        for uid, project in projects.items():
+            writer.write(project, id=uid)
+    corpus.write_column(
+        "award", list(projects), [p["award"] for p in projects.values()], corpus_path
+    )
+
+    version = "bench"
+    root = os.path.join(workdir, "snapshots", version)
+    chroma_dir, mmap_dir, projects_file = similar_to_others.snapshot_paths(version)
+    os.makedirs(root)
+    shutil.copy(
+        os.path.join(workdir, "output", "project_id_to_data.json"),
+        os.path.join(workdir, projects_file),
+    )
+
+    ids, texts, awards = [], [], []
+    for uid, project in projects.items():
+        description = project["parsed_content"]["description_markdown"]
+        for text in chunking.chunk(description) if chunked else [description]:
+            ids.append(uid)
+            texts.append(text)
+            awards.append(project["award"])
+    if backend == "chroma":
+        from langchain_community.vectorstores import Chroma
+        from langchain_core.documents import Document
+
+        documents = [
+            Document(text, metadata={"id": uid, "award": award})
+            for uid, text, award in zip(ids, texts, awards)
+        ]
+        db = Chroma.from_documents(
+            documents,
+            similar_to_others.get_embeddings(),
+            persist_directory=os.path.join(workdir, chroma_dir),
+        )
+        mmap_store.export_from_chroma(db, projects, os.path.join(workdir, mmap_dir))
+    else:
+        vectors = np.stack([fakes.hash_embedding(t) for t in texts])
+        mmap_store.write_snapshot(
+            os.path.join(workdir, mmap_dir), ids, vectors, awards, projects
+        )
+
+    with open(os.path.join(workdir, "snapshots", "CURRENT"), "w") as f:
+        f.write(version)
+    return projects
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(workdir, env):
+    port = free_port()
+    # The server logs every upstream request at INFO; keep that out of the report
+    log_path = os.path.join(workdir, "api.log")
+    with open(log_path, "wb") as log:
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--port", str(port), "--log-level", "warning",
+            ],
+            cwd=workdir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/ready").status_code == 200:
+                return server, url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    server.terminate()
+    with open(log_path) as f:
+        sys.stderr.write(f.read())
+    raise TimeoutError("API did not become ready")
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else float("nan")
+
+
+def report(name, latencies, errors, elapsed, rejected=0):
+    print(
+        f"{name:<20} n={len(latencies):<6} err={errors:<4} rej={rejected:<4}"
+        f" p50={percentile(latencies, 50):8.1f}ms"
+        f" p95={percentile(latencies, 95):8.1f}ms"
+        f" p99={percentile(latencies, 99):8.1f}ms"
+        f" throughput={len(latencies) / elapsed:8.1f}/s"
+    )
+
+
+async def drive(url, path, make_payload, requests, concurrency, stream=False):
+    """Sends `requests` POSTs with at most `concurrency` in flight.
+
+    429 and 503 responses are counted as rejected by admission control, not
+    as errors.
+    """
+    latencies, errors, rejected = [], 0, 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker(client):
+        nonlocal errors, rejected
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                if stream:
+                    async with client.stream("POST", path, json=make_payload(i)) as r:
+                        async for _ in r.aiter_lines():
+                            pass
+                else:
+                    r = await client.post(path, json=make_payload(i))
+                if r.status_code in (429, 503):
+                    rejected += 1
+                    continue
+                if r.status_code >= 400:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed, rejected
+
+
+async def drive_with_flood(url, scenarios, name, flood, args):
+    """Drives one scenario, optionally while another floods the server."""
+    path, make_payload, stream = scenarios[name]
+    runs = [
+        drive(url, path, make_payload, args.requests, args.concurrency, stream)
+    ]
+    if flood:
+        path, make_payload, stream = scenarios[flood]
+        runs.append(
+            drive(
+                url,
+                path,
+                make_payload,
+                args.flood_requests,
+                args.flood_concurrency,
+                stream,
+            )
+        )
+    return await asyncio.gather(*runs)
+
+
+def api_scenarios(args, projects, devpost_url):
+    ids = list(projects)
+    texts = [p["parsed_content"]["description_markdown"] for p in projects.values()]
+    rng = random.Random(0)
+    # A fixed pool of distinct queries, so repeats exercise the caches the way
+    # popular queries do in production
+    queries = [
+        rng.choice(texts)[:2000] + f" variant {i}" for i in range(args.distinct)
+    ]
+
+    def query(i):
+        return queries[i % len(queries)]
+
+    def some_ids(i):
+        return [ids[(i * 3 + j) % len(ids)] for j in range(3)]
+
+    def search(i):
+        return {"document_or_link": query(i), "k": 3, "filter": {"award": "big"}}
+
+    def link(i):
+        url = f"{devpost_url}/software/project-{i % args.distinct}"
+        return {"document_or_link": url, "k": 3}
+
+    def batch(i):
+        # 32 inputs a request, a quarter of them links to scrape
+        documents = [query(i * 32 + j) for j in range(24)]
+        documents += [link(i * 32 + j)["document_or_link"] for j in range(8)]
+        return {"documents": documents, "k": 3}
+
+    # name -> (path, payload for request i, response is streamed)
+    return {
+        "similar": ("/similar", search, False),
+        "similar_link": ("/similar", link, False),
+        "similar_batch": ("/similar/batch", batch, True),
+        "arena": ("/arena", lambda i: {"project_doc": query(i)}, False),
+        "what-they-did": ("/what-they-did", lambda i: {"ids": some_ids(i)}, False),
+        "how-they-won": ("/how-they-won", lambda i: {"ids": some_ids(i)}, False),
+        "project-insights": ("/project-insights", search, True),
+        "win-score": (
+            "/win-score",
+            lambda i: {"documents": [query(i + j) for j in range(8)]},
+            False,
+        ),
+    }
+
+
+def run_scrape_submission(args, devpost_url):
+    from scrape.devpost_page_scraper import DevpostScraper
+
+    scraper = DevpostScraper()
+    latencies = []
+
+    def scrape(i):
+        start = time.perf_counter()
+        result = scraper.scrape_submission(f"{devpost_url}/software/project-{i}")
+        latencies.append(time.perf_counter() - start)
+        return result is not None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        ok = list(pool.map(scrape, range(args.requests)))
+    report("scrape_submission", latencies, ok.count(False), time.perf_counter() - start)
+
+
+def run_scrape_gallery(args, devpost_url, workdir):
+    from scrape.devpost_find_projects import DevPostScraper
+
+    output = os.path.join(workdir, "gallery.jsonl")
+    scraper = DevPostScraper(
+        base_url=f"{devpost_url}/project-gallery", output_file=output
+    )
+    start = time.perf_counter()
+    found = scraper.scrape_projects()
+    elapsed = time.perf_counter() - start
+    pages = -(-args.projects // 24)
+    print(
+        f"{'scrape_gallery':<20} pages={pages:<4} projects={len(found):<6}"
+        f" per_page={elapsed / pages * 1000:8.1f}ms"
+        f" throughput={len(found) / elapsed:8.1f}/s"
+    )
+
+
+def run_triplets(args, name):
+    try:
+        if name == "triplets":
+            from build_data import build_triplets as builder
+        else:
+            from build_data import build_triplets_parallel as builder
+    except ImportError as e:
+        print(f"{name:<20} skipped: {e}")
+        return
+
+    projects = list(builder.id_to_doc.values())
+    kwargs = {"num_train": args.triplets, "num_val": 0, "num_test": 0}
+    if name == "triplets_parallel":
+        kwargs["num_processes"] = args.concurrency
+    start = time.perf_counter()
+    builder.export_triplet_dataset(projects, f"output/{name}", **kwargs)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<20} n={args.triplets:<6} elapsed={elapsed:8.2f}s"
+        f" throughput={args.triplets / elapsed:8.1f}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", type=int, default=1000, help="Corpus size")
+    parser.add_argument("--requests", type=int, default=200, help="Per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--distinct", type=int, default=50, help="Distinct queries per scenario"
+    )
+    parser.add_argument("--triplets", type=int, default=500)
+    parser.add_argument("--backend", choices=["mmap", "chroma"], default="mmap")
+    parser.add_argument(
+        "--chunked", action="store_true", help="Index descriptions as chunks"
+    )
+    parser.add_argument(
+        "--retrieval", choices=["vector", "hybrid", "lexical"], default="vector"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--devpost-latency", type=float, default=0.0)
+    parser.add_argument("--ranker-latency", type=float, default=0.0)
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument(
+        "--flood",
+        choices=SCENARIOS[:8],
+        help="Endpoint to flood while each API scenario is measured",
+    )
+    parser.add_argument("--flood-requests", type=int, default=400)
+    parser.add_argument("--flood-concurrency", type=int, default=64)
+    args = parser.parse_args()
+    # The scrapers configure INFO logging, which would log every fake request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    cohere = fakes.FakeCohere(args.embed_latency).start()
+    openai = fakes.FakeOpenAI(args.llm_latency).start()
+    devpost = fakes.FakeDevpost(args.projects, latency=args.devpost_latency).start()
+    ranker = fakes.FakeRanker(args.ranker_latency).start()
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([REPO, os.environ.get("PYTHONPATH", "")]),
+        FLIGHTDECK_INDEX=args.backend,
+        FLIGHTDECK_RETRIEVAL=args.retrieval,
+        COHERE_API_KEY="fake",
+        COHERE_BASE_URL=cohere.url,
+        OPENAI_API_KEY="fake",
+        OPENAI_BASE_URL=openai.url + "/v1",
+        FLIGHTDECK_RANKER_URL=ranker.url,
+    )
+    # The scrapers and triplet builders run in this process
+    os.environ.update(env)
+
+    workdir = tempfile.mkdtemp(prefix="flightdeck-bench-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        start = time.perf_counter()
+        projects = build_corpus(workdir, args.projects, args.backend, args.chunked)
+        elapsed = time.perf_counter() - start
+        print(f"built {len(projects)}-project corpus in {elapsed:.1f}s")
+
+        scenarios = api_scenarios(args, projects, devpost.url)
+        wanted = [s for s in args.only if s in scenarios]
+        if wanted:
+            server, url = start_api(workdir, env)
+            try:
+                for name in wanted:
+                    results = asyncio.run(
+                        drive_with_flood(url, scenarios, name, args.flood, args)
+                    )
+                    report(name, *results[0])
+                    if args.flood:
+                        report(f"  +{args.flood}", *results[1])
+            finally:
+                server.terminate()
+                server.wait()
+
+        if "scrape_submission" in args.only:
+            run_scrape_submission(args, devpost.url)
+        if "scrape_gallery" in args.only:
+            run_scrape_gallery(args, devpost.url, workdir)
+        # Each builder gets a fresh process: the parallel one forks a pool, and
+        # forking this process (fake server threads, open HTTP clients) can hang
+        spawn = mp.get_context("spawn")
+        for name in ("triplets", "triplets_parallel"):
+            if name in args.only:
+                proc = spawn.Process(target=run_triplets, args=(args, name))
+                proc.start()
+                proc.join()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        for fake in (cohere, openai, devpost, ranker):
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Recall, memory and query time of the quantized index modes against exact
+float search.
+
+For each mode (and each re-rank depth for the quantized ones) reports:
+  scan MB    size of the array every query reads in full; the float vectors
+             a quantized mode re-ranks are only touched a few rows at a time
+  query ms   mean MmapIndex.search time, page cache warm
+  recall@k   fraction of exact search's top k that the mode also returns
+
+No embedder is needed. With --synthetic, queries are held-out vectors drawn
+like the corpus but not in it. Against a real snapshot they are stored
+vectors plus noise of the same norm, about 45 degrees away, so a query's
+neighbours are not just its source row and its near copies.
+
+Each mode's default re-rank depth is meant to bring recall close to 1, so
+rerank=1, where the quantized scan alone picks the results, is reported
+too: that is where int8 and binary differ.
+
+Run from the repository root:
+    python bench/quantization.py
+    python bench/quantization.py --synthetic 100000 --rerank 5 10 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mmap_store  # noqa: E402
+import similar_to_others  # noqa: E402
+
+
+def write_synthetic(out_dir, n, num_queries, dim=1024, clusters=200):
+    """Clustered unit vectors, closer to real embeddings than pure noise.
+
+    Writes n of them and returns num_queries more, drawn the same way, as
+    held-out queries.
+    """
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, n + num_queries)]
+    vectors += 0.8 * rng.standard_normal(vectors.shape, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors, queries = vectors[:n], vectors[n:]
+    ids = [f"{i:036d}" for i in range(n)]
+    awards = [mmap_store.AWARDS[i % 3] for i in range(n)]
+    projects = {uid: {"title": f"Project {uid}"} for uid in ids}
+    mmap_store.write_snapshot(out_dir, ids, vectors, awards, projects)
+    return queries
+
+
+def make_queries(index, num_queries, noise=1.0):
+    """Stored vectors plus random noise of noise times their norm."""
+    rng = np.random.default_rng(1)
+    rows = rng.integers(0, len(index.vectors), num_queries)
+    queries = np.array(index.vectors[rows])
+    dim = queries.shape[1]
+    queries += noise / np.sqrt(dim) * rng.standard_normal(queries.shape, dtype=np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def scanned_bytes(index):
+    if index.quantization == "int8":
+        return index.codes.nbytes + index.scales.nbytes
+    if index.quantization == "binary":
+        return index.bits.nbytes
+    return index.vectors.nbytes
+
+
+def run(index, queries, k, truth):
+    index.warm()
+    index.search(queries[0], k)
+    start = time.perf_counter()
+    results = [index.search(q, k) for q in queries]
+    elapsed = time.perf_counter() - start
+    recall = np.mean(
+        [
+            len({row for row, _ in got} & expected) / len(expected)
+            for got, expected in zip(results, truth)
+        ]
+    )
+    return elapsed / len(queries) * 1000, recall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--synthetic", type=int, help="Generate a corpus of this many vectors"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument(
+        "--rerank",
+        type=int,
+        nargs="+",
+        default=[1, None],
+        help="Candidates re-ranked per result (default: 1 and each mode's own)",
+    )
+    args = parser.parse_args()
+
+    _, snapshot_dir, _ = similar_to_others.snapshot_paths(
+        similar_to_others.published_version()
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        queries = None
+        if args.synthetic:
+            snapshot_dir = tmp
+            queries = write_synthetic(tmp, args.synthetic, args.queries)
+
+        exact = mmap_store.MmapIndex(snapshot_dir)
+        if queries is None:
+            queries = make_queries(exact, args.queries)
+        truth = [{row for row, _ in exact.search(q, args.k)} for q in queries]
+        n, dim = exact.vectors.shape
+        print(f"{n} vectors x {dim} dims, k={args.k}, {args.queries} queries")
+
+        modes = [(None, None)] + [
+            (q, r) for q in mmap_store.QUANTIZATIONS for r in args.rerank
+        ]
+        for quantization, rerank in modes:
+            index = mmap_store.MmapIndex(snapshot_dir, quantization, rerank)
+            ms, recall = run(index, queries, args.k, truth)
+            name = quantization or "float32"
+            if quantization:
+                name += f" rerank={index.rerank}"
+            print(
+                f"{name:<20} scan {scanned_bytes(index) / 2**20:8.1f} MB"
+                f"   query {ms:7.2f} ms   recall@{args.k} {recall:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
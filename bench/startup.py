@@ -0,0 +1,111 @@
+"""
+Measures how long the API process takes to become usable.
+
+Reports the cost of `import main` (with the slowest modules from
+`python -X importtime`), then starts uvicorn and times how long it takes to
+accept a connection and for /ready to report the warm-up as finished.
+
+Run from the repository root: python bench/startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def import_time(python):
+    start = time.perf_counter()
+    subprocess.run([python, "-c", "import main"], check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(python, top=10):
+    """Parses -X importtime output into (cumulative seconds, module) pairs."""
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", "import main"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        rows.append((int(cumulative) / 1e6, module.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_ready(python, timeout=120.0):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/ready"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [python, "-m", "uvicorn", "main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    accepting = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as r:
+                    json.load(r)
+                elapsed = time.perf_counter() - start
+                return accepting or elapsed, elapsed
+            except urllib.error.HTTPError:
+                # 503 while warming up: the server is already accepting requests
+                if accepting is None:
+                    accepting = time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"server did not become ready within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(name, samples):
+    print(
+        f"{name:<24} median {statistics.median(samples) * 1000:8.1f} ms"
+        f"   min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    if not os.path.exists("main.py"):
+        sys.exit("Run this from the repository root")
+
+    imports = [import_time(args.python) for _ in range(args.runs)]
+    accepting, ready = zip(*(time_to_ready(args.python) for _ in range(args.runs)))
+
+    summarize("import main", imports)
+    summarize("accepting connections", accepting)
+    summarize("ready", ready)
+
+    print("\nSlowest imports (cumulative):")
+    for seconds, module in slowest_imports(args.python):
+        print(f"  {seconds * 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
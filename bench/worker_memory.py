@@ -0,0 +1,128 @@
+"""
+Compares per-worker memory of the two ways the API can hold its data.
+
+  json  every worker parses project_id_to_data.json and loads its own copy of
+        the vectors (what each worker does with the Chroma backend)
+  mmap  every worker maps the same snapshot written by mmap_store.py
+
+Starts N worker processes per mode, has each one run a search and touch every
+project record, then reads /proc/<pid>/smaps_rollup while all of them are
+alive. PSS splits shared pages between the processes mapping them, so its
+total is the real memory cost of the worker pool. Linux only.
+
+Run from the repository root:
+    python bench/worker_memory.py --workers 4
+    python bench/worker_memory.py --workers 4 --synthetic 20000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+
+import numpy as np
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mmap_store  # noqa: E402
+import similar_to_others  # noqa: E402
+
+
+def smaps_rollup():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return fields
+
+
+def worker(mode, snapshot_dir, projects_path, barrier, results):
+    if mode == "json":
+        with open(projects_path, "rb") as f:
+            projects = orjson.loads(f.read())
+        vectors = np.load(os.path.join(snapshot_dir, "vectors.npy"))
+        touched = sum(len(orjson.dumps(p)) for p in projects.values())
+        vectors @ vectors[0]
+    else:
+        projects = mmap_store.ProjectStore(snapshot_dir)
+        index = mmap_store.MmapIndex(snapshot_dir)
+        touched = sum(len(projects.blob(uid)) for uid in projects)
+        index.search(index.vectors[0], 10)
+    barrier.wait()
+    stats = smaps_rollup()
+    results.put((mode, touched, stats["Rss"], stats["Pss"]))
+    barrier.wait()
+
+
+def write_synthetic(out_dir, n, dim=1024):
+    rng = np.random.default_rng(0)
+    ids = [f"{i:036d}" for i in range(n)]
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    awards = [mmap_store.AWARDS[i % 3] for i in range(n)]
+    projects = {
+        uid: {
+            "title": f"Project {uid}",
+            "parsed_content": {"description_markdown": "lorem ipsum " * 300},
+        }
+        for uid in ids
+    }
+    mmap_store.write_snapshot(out_dir, ids, vectors, awards, projects)
+    path = os.path.join(out_dir, "project_id_to_data.json")
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(projects))
+    return path
+
+
+def run(mode, workers, snapshot_dir, projects_path):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=worker, args=(mode, snapshot_dir, projects_path, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    stats = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    rss = [s[2] for s in stats]
+    pss = [s[3] for s in stats]
+    mb = 1024 * 1024
+    print(
+        f"{mode:<5} workers={workers}  RSS/worker {np.mean(rss) / mb:8.1f} MB"
+        f"   PSS/worker {np.mean(pss) / mb:8.1f} MB"
+        f"   PSS total {sum(pss) / mb:8.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--synthetic", type=int, help="Generate a corpus of this many projects"
+    )
+    args = parser.parse_args()
+
+    _, mmap_dir, projects_file = similar_to_others.snapshot_paths(
+        similar_to_others.published_version()
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_dir, projects_path = mmap_dir, projects_file
+        if args.synthetic:
+            snapshot_dir = tmp
+            projects_path = write_synthetic(tmp, args.synthetic)
+
+        for mode in ["json", "mmap"]:
+            run(mode, args.workers, snapshot_dir, projects_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
+import argparse
 import random
-import json
 from tqdm import tqdm
 import numpy as np
 from functools import lru_cache
-from typing import List, Dict, Tuple
+from typing import Dict, Iterator, List, Tuple
 from similar_to_others import get_similar
+import corpus
 from datasets import Dataset, DatasetDict
+from build_data import triplet_export
 
 
-id_to_doc = json.load(open("output/project_id_to_data.json", "r"))
+# Only the columns the sampler uses, not the full scraped records
+id_to_doc = {
+    project["id"]: project
+    for project in corpus.read(["id", "description", "award"]).to_pylist()
+}
 
 @lru_cache(maxsize=100000)
 def cached_get_similar(text: str, award_filter: str) -> List[Tuple]:
@@ -24,235 +30,240 @@ def cached_get_similar(text: str, award_filter: str) -> List[Tuple]:
     """
     return get_similar(text, k=10, filt={"award": award_filter})
 
-def create_triplet_dataset(
-    projects: List[Dict],
-    num_train: int = 15000,
-    num_val: int = 500,
-    num_test: int = 500,
-    random_seed: int = 42,
-) -> DatasetDict:
+def split_by_award(projects: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Organize projects by win status: winning, partially winning and losing."""
+    return (
+        [p for p in projects if p["award"] == "big"],
+        [p for p in projects if p["award"] == "small"],
+        [p for p in projects if p["award"] == "none"],
+    )
+
+
+def generate_triplets(
+    num_samples: int,
+    winning_projects: List[Dict],
+    partial_projects: List[Dict],
+    losing_projects: List[Dict],
+    similar_ratio: float = 0.7,
+) -> Iterator[Tuple[Dict, Dict, Dict, str]]:
     """
-    Create train/val/test triplet datasets for project success prediction.
+    Generate triplets using both similar and random samples for positive pairs,
+    ensuring no duplicates between anchor and positive samples.
 
     Args:
-        projects: List of project dictionaries with 'win_status' and 'text' keys
-        get_similar: Function to get semantically similar projects
-        num_train: Number of training triplets
-        num_val: Number of validation triplets
-        num_test: Number of test triplets
-        random_seed: Random seed for reproducibility
+        num_samples: Number of triplets to generate
+        winning_projects: List of winning project dictionaries
+        partial_projects: List of partially successful project dictionaries
+        losing_projects: List of unsuccessful project dictionaries
+        similar_ratio: Ratio of similar vs random samples for positive pairs (default: 0.7)
 
-    Returns:
-        DatasetDict containing train, validation, and test datasets
+    Yields:
+        (anchor, positive, negative, anchor status) tuples of project dictionaries
     """
-    random.seed(random_seed)
-    np.random.seed(random_seed)
 
-    # Organize projects by win status
-    winning_projects = [p for p in projects if p["award"] == "big"]
-    partial_projects = [p for p in projects if p["award"] == "small"]
-    losing_projects = [p for p in projects if p["award"] == "none"]
-
-    def generate_triplets(
-        num_samples: int, similar_ratio: float = 0.7
-    ) -> Dict[str, List[str]]:
-        """
-        Generate triplets using both similar and random samples for positive pairs,
-        ensuring no duplicates between anchor and positive samples.
-
-        Args:
-            num_samples: Number of triplets to generate
-            winning_projects: List of winning project dictionaries
-            partial_projects: List of partially successful project dictionaries
-            losing_projects: List of unsuccessful project dictionaries
-            get_similar: Function to get semantically similar projects
-            similar_ratio: Ratio of similar vs random samples for positive pairs (default: 0.7)
-
-        Returns:
-            Dictionary with anchors, positives, negatives, and anchor status
-        """
-        anchors = []
-        positives = []
-        negatives = []
-        anchor_status = []
-
-        def filter_anchor_from_similar(similar_projects, anchor_text):
-            """Filter out the anchor project from similar projects list."""
-            return [
-                id_to_doc[p.metadata["id"]]
-                for p, _score in similar_projects
-                if id_to_doc[p.metadata["id"]]["parsed_content"]["description_markdown"] != anchor_text
-            ]
-
-        for _ in tqdm(range(num_samples), total=num_samples):
-            # Select category with focus on winning/losing
-            category = random.choices(
-                ["winning", "partial", "losing"], weights=[0.34, 0.33, 0.33]
-            )[0]
-
-            if category == "winning":
-                anchor = random.choice(winning_projects)
-                # Decide between similar or random positive
-                if random.random() < similar_ratio:
-                    # Get similar winning projects and filter out anchor
-                    similar_winning = get_similar(
-                        anchor["parsed_content"]["description_markdown"],
-                        k=10,
-                        filt={"award": "big"},
-                    )  # Get more samples to ensure we have enough after filtering
-                    filtered_similar = filter_anchor_from_similar(
-                        similar_winning,
-                        anchor["parsed_content"]["description_markdown"],
-                    )
-                    if (
-                        filtered_similar
-                    ):  # If we have valid similar projects after filtering
-                        positive = random.choice(filtered_similar)
-                    else:  # Fallback to random if no valid similar projects
-                        positive = random.choice(
-                            [p for p in winning_projects if p != anchor]
-                        )
-                else:
-                    # Get random winning project as positive
+    def filter_anchor_from_similar(similar_projects, anchor_text):
+        """Filter out the anchor project from similar projects list."""
+        return [
+            id_to_doc[p.metadata["id"]]
+            for p, _score in similar_projects
+            if id_to_doc[p.metadata["id"]]["description"] != anchor_text
+        ]
+
+    for _ in range(num_samples):
+        # Select category with focus on winning/losing
+        category = random.choices(
+            ["winning", "partial", "losing"], weights=[0.34, 0.33, 0.33]
+        )[0]
+
+        if category == "winning":
+            anchor = random.choice(winning_projects)
+            # Decide between similar or random positive
+            if random.random() < similar_ratio:
+                # Get similar winning projects and filter out anchor
+                similar_winning = get_similar(
+                    anchor["description"],
+                    k=10,
+                    filt={"award": "big"},
+                )  # Get more samples to ensure we have enough after filtering
+                filtered_similar = filter_anchor_from_similar(
+                    similar_winning,
+                    anchor["description"],
+                )
+                if (
+                    filtered_similar
+                ):  # If we have valid similar projects after filtering
+                    positive = random.choice(filtered_similar)
+                else:  # Fallback to random if no valid similar projects
                     positive = random.choice(
                         [p for p in winning_projects if p != anchor]
                     )
+            else:
+                # Get random winning project as positive
+                positive = random.choice(
+                    [p for p in winning_projects if p != anchor]
+                )
 
-                negative_to_sample_from = losing_projects if random.random() < 0.5 else partial_projects
-                name_to_sample_from = "small" if random.random() < 0.5 else "none"
-                if random.random() < similar_ratio:
-                    similar_losing = get_similar(
-                        anchor["parsed_content"]["description_markdown"],
-                        k=10,
-                        filt={"award": name_to_sample_from},
-                    )  # Get more samples to ensure we have enough after filtering
-                    filtered_similar = filter_anchor_from_similar(
-                        similar_losing,
-                        anchor["parsed_content"]["description_markdown"],
+            negative_to_sample_from = losing_projects if random.random() < 0.5 else partial_projects
+            name_to_sample_from = "small" if random.random() < 0.5 else "none"
+            if random.random() < similar_ratio:
+                similar_losing = get_similar(
+                    anchor["description"],
+                    k=10,
+                    filt={"award": name_to_sample_from},
+                )  # Get more samples to ensure we have enough after filtering
+                filtered_similar = filter_anchor_from_similar(
+                    similar_losing,
+                    anchor["description"],
+                )
+                if (
+                    filtered_similar
+                ):  # If we have valid similar projects after filtering
+                    negative = random.choice(filtered_similar)
+                else:  # Fallback to random if no valid similar projects
+                    negative = random.choice(
+                        [p for p in negative_to_sample_from if p != anchor]
                     )
-                    if (
-                        filtered_similar
-                    ):  # If we have valid similar projects after filtering
-                        negative = random.choice(filtered_similar)
-                    else:  # Fallback to random if no valid similar projects
-                        negative = random.choice(
-                            [p for p in negative_to_sample_from if p != anchor]
-                        )
-                else:
-                    negative = random.choice(negative_to_sample_from)
-
-            elif category == "losing":
-                anchor = random.choice(losing_projects)
-                if random.random() < similar_ratio:
-                    # Get similar losing projects and filter out anchor
-                    similar_losing = get_similar(
-                        anchor["parsed_content"]["description_markdown"],
-                        k=10,
-                        filt={"award": "none"},
-                    )
-                    filtered_similar = filter_anchor_from_similar(
-                        similar_losing, anchor["parsed_content"]["description_markdown"]
-                    )
-                    if filtered_similar:
-                        positive = random.choice(filtered_similar)
-                    else:
-                        positive = random.choice(
-                            [p for p in losing_projects if p != anchor]
-                        )
+            else:
+                negative = random.choice(negative_to_sample_from)
+
+        elif category == "losing":
+            anchor = random.choice(losing_projects)
+            if random.random() < similar_ratio:
+                # Get similar losing projects and filter out anchor
+                similar_losing = get_similar(
+                    anchor["description"],
+                    k=10,
+                    filt={"award": "none"},
+                )
+                filtered_similar = filter_anchor_from_similar(
+                    similar_losing, anchor["description"]
+                )
+                if filtered_similar:
+                    positive = random.choice(filtered_similar)
                 else:
-                    # Get random losing project as positive
                     positive = random.choice(
                         [p for p in losing_projects if p != anchor]
                     )
+            else:
+                # Get random losing project as positive
+                positive = random.choice(
+                    [p for p in losing_projects if p != anchor]
+                )
 
-                negative_to_sample_from = winning_projects if random.random() < 0.5 else partial_projects
-                name_to_sample_from = "big" if random.random() < 0.5 else "small"
-                if random.random() < similar_ratio:
-                    similar_losing = get_similar(
-                        anchor["parsed_content"]["description_markdown"],
-                        k=10,
-                        filt={"award": name_to_sample_from},
-                    )  # Get more samples to ensure we have enough after filtering
-                    filtered_similar = filter_anchor_from_similar(
-                        similar_losing,
-                        anchor["parsed_content"]["description_markdown"],
+            negative_to_sample_from = winning_projects if random.random() < 0.5 else partial_projects
+            name_to_sample_from = "big" if random.random() < 0.5 else "small"
+            if random.random() < similar_ratio:
+                similar_losing = get_similar(
+                    anchor["description"],
+                    k=10,
+                    filt={"award": name_to_sample_from},
+                )  # Get more samples to ensure we have enough after filtering
+                filtered_similar = filter_anchor_from_similar(
+                    similar_losing,
+                    anchor["description"],
+                )
+                if (
+                    filtered_similar
+                ):  # If we have valid similar projects after filtering
+                    negative = random.choice(filtered_similar)
+                else:  # Fallback to random if no valid similar projects
+                    negative = random.choice(
+                        [p for p in negative_to_sample_from if p != anchor]
                     )
-                    if (
-                        filtered_similar
-                    ):  # If we have valid similar projects after filtering
-                        negative = random.choice(filtered_similar)
-                    else:  # Fallback to random if no valid similar projects
-                        negative = random.choice(
-                            [p for p in negative_to_sample_from if p != anchor]
-                        )
-                else:
-                    negative = random.choice(negative_to_sample_from)
-
-            else:  # partial
-                anchor = random.choice(partial_projects)
-                if random.random() < similar_ratio:
-                    # Get similar partial projects and filter out anchor
-                    similar_partial = get_similar(
-                        anchor["parsed_content"]["description_markdown"],
-                        k=10,
-                        filt={"award": "small"},
-                    )
-                    filtered_similar = filter_anchor_from_similar(
-                        similar_partial,
-                        anchor["parsed_content"]["description_markdown"],
-                    )
-                    if filtered_similar:
-                        positive = random.choice(filtered_similar)
-                    else:
-                        positive = random.choice(
-                            [p for p in partial_projects if p != anchor]
-                        )
+            else:
+                negative = random.choice(negative_to_sample_from)
+
+        else:  # partial
+            anchor = random.choice(partial_projects)
+            if random.random() < similar_ratio:
+                # Get similar partial projects and filter out anchor
+                similar_partial = get_similar(
+                    anchor["description"],
+                    k=10,
+                    filt={"award": "small"},
+                )
+                filtered_similar = filter_anchor_from_similar(
+                    similar_partial,
+                    anchor["description"],
+                )
+                if filtered_similar:
+                    positive = random.choice(filtered_similar)
                 else:
-                    # Get random partial project as positive
                     positive = random.choice(
                         [p for p in partial_projects if p != anchor]
                     )
+            else:
+                # Get random partial project as positive
+                positive = random.choice(
+                    [p for p in partial_projects if p != anchor]
+                )
 
-                # Get negative sample
-                negative_to_sample_from = winning_projects if random.random() < 0.5 else losing_projects
-                name_to_sample_from = "big" if random.random() < 0.5 else "none"
-                if random.random() < similar_ratio:
-                    similar_losing = get_similar(
-                        anchor["parsed_content"]["description_markdown"],
-                        k=10,
-                        filt={"award": name_to_sample_from},
-                    )  # Get more samples to ensure we have enough after filtering
-                    filtered_similar = filter_anchor_from_similar(
-                        similar_losing,
-                        anchor["parsed_content"]["description_markdown"],
+            # Get negative sample
+            negative_to_sample_from = winning_projects if random.random() < 0.5 else losing_projects
+            name_to_sample_from = "big" if random.random() < 0.5 else "none"
+            if random.random() < similar_ratio:
+                similar_losing = get_similar(
+                    anchor["description"],
+                    k=10,
+                    filt={"award": name_to_sample_from},
+                )  # Get more samples to ensure we have enough after filtering
+                filtered_similar = filter_anchor_from_similar(
+                    similar_losing,
+                    anchor["description"],
+                )
+                if (
+                    filtered_similar
+                ):  # If we have valid similar projects after filtering
+                    negative = random.choice(filtered_similar)
+                else:  # Fallback to random if no valid similar projects
+                    negative = random.choice(
+                        [p for p in negative_to_sample_from if p != anchor]
                     )
-                    if (
-                        filtered_similar
-                    ):  # If we have valid similar projects after filtering
-                        negative = random.choice(filtered_similar)
-                    else:  # Fallback to random if no valid similar projects
-                        negative = random.choice(
-                            [p for p in negative_to_sample_from if p != anchor]
-                        )
-                else:
-                    negative = random.choice(negative_to_sample_from)
+            else:
+                negative = random.choice(negative_to_sample_from)
+
+        yield anchor, positive, negative, category
 
-            anchors.append(anchor["parsed_content"]["description_markdown"])
-            positives.append(positive["parsed_content"]["description_markdown"])
-            negatives.append(negative["parsed_content"]["description_markdown"])
-            anchor_status.append(category)
 
+def create_triplet_dataset(
+    projects: List[Dict],
+    num_train: int = 15000,
+    num_val: int = 500,
+    num_test: int = 500,
+    random_seed: int = 42,
+) -> DatasetDict:
+    """
+    Create train/val/test triplet datasets for project success prediction.
+
+    Args:
+        projects: List of project dictionaries with 'win_status' and 'text' keys
+        get_similar: Function to get semantically similar projects
+        num_train: Number of training triplets
+        num_val: Number of validation triplets
+        num_test: Number of test triplets
+        random_seed: Random seed for reproducibility
+
+    Returns:
+        DatasetDict containing train, validation, and test datasets
+    """
+    random.seed(random_seed)
+    np.random.seed(random_seed)
+
+    groups = split_by_award(projects)
+
+    def generate_split(num_samples: int) -> Dict[str, List[str]]:
+        triplets = list(tqdm(generate_triplets(num_samples, *groups), total=num_samples))
         return {
-            "anchor": anchors,
-            "positive": positives,
-            "negative": negatives,
-            "anchor_status": anchor_status,
+            "anchor": [anchor["description"] for anchor, _, _, _ in triplets],
+            "positive": [positive["description"] for _, positive, _, _ in triplets],
+            "negative": [negative["description"] for _, _, negative, _ in triplets],
+            "anchor_status": [status for _, _, _, status in triplets],
         }
 
     # Generate splits
-    train_data = generate_triplets(num_train)
-    val_data = generate_triplets(num_val)
-    test_data = generate_triplets(num_test)
+    train_data = generate_split(num_train)
+    val_data = generate_split(num_val)
+    test_data = generate_split(num_test)
 
     # Create dataset dictionary
     dataset_dict = DatasetDict(
@@ -266,11 +277,52 @@ def create_triplet_dataset(
     return dataset_dict
 
 
+def export_triplet_dataset(
+    projects: List[Dict],
+    out_dir: str = triplet_export.OUT_DIR,
+    num_train: int = 15000,
+    num_val: int = 500,
+    num_test: int = 500,
+    random_seed: int = 42,
+    ids_only: bool = False,
+) -> Dict:
+    """
+    Stream train/val/test triplets into sharded Parquet files under out_dir.
+
+    Produces the same triplets as create_triplet_dataset without holding them
+    in memory; see triplet_export for the layout.
+
+    Returns:
+        The export manifest
+    """
+    random.seed(random_seed)
+    np.random.seed(random_seed)
+    groups = split_by_award(projects)
+    splits = {
+        "train": (num_train, generate_triplets(num_train, *groups)),
+        "validation": (num_val, generate_triplets(num_val, *groups)),
+        "test": (num_test, generate_triplets(num_test, *groups)),
+    }
+    return triplet_export.export(out_dir, splits, projects, ids_only=ids_only)
+
+
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=triplet_export.OUT_DIR)
+    parser.add_argument(
+        "--ids-only",
+        action="store_true",
+        help="Store project ids instead of descriptions",
+    )
+    parser.add_argument(
+        "--push",
+        metavar="REPO",
+        help="Also upload the export, e.g. to jonathanli/hackathon-triplets-large",
+    )
+    args = parser.parse_args()
 
     projects = list(id_to_doc.values())
-    dataset = create_triplet_dataset(projects)
-    dataset.push_to_hub(
-        "jonathanli/hackathon-triplets-large",
-    )
+    export_triplet_dataset(projects, args.out, ids_only=args.ids_only)
+    if args.push:
+        triplet_export.push(args.out, args.push)
@@ -1,14 +1,20 @@
+import argparse
 import random
-import json
 from tqdm import tqdm
 import numpy as np
 from functools import lru_cache
-from typing import List, Dict, Tuple
+from typing import Dict, Iterator, List, Tuple
 from similar_to_others import get_similar
+import corpus
 from datasets import Dataset, DatasetDict
+from build_data import triplet_export
 import multiprocessing as mp
 
-id_to_doc = json.load(open("output/project_id_to_data.json", "r"))
+# Only the columns the sampler uses, not the full scraped records
+id_to_doc = {
+    project["id"]: project
+    for project in corpus.read(["id", "description", "award"]).to_pylist()
+}
 
 @lru_cache(maxsize=100000)
 def cached_get_similar(text: str, award_filter: str) -> List[Tuple]:
@@ -17,17 +23,37 @@ def cached_get_similar(text: str, award_filter: str) -> List[Tuple]:
     """
     return get_similar(text, k=10, filt={"award": award_filter})
 
-def generate_single_triplet(args):
+# (winning, partial, losing) projects, set once per worker by init_worker
+# instead of being pickled with every task
+_groups = None
+
+def init_worker(groups):
+    global _groups
+    _groups = groups
+
+def split_by_award(projects: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Organize projects by win status: winning, partially winning and losing."""
+    return (
+        [p for p in projects if p["award"] == "big"],
+        [p for p in projects if p["award"] == "small"],
+        [p for p in projects if p["award"] == "none"],
+    )
+
+def generate_single_triplet(task):
     """
     Generate a single triplet. This function will be called by each process.
     
     Args:
-        args: Tuple containing (similar_ratio, winning_projects, partial_projects, losing_projects)
+        task: Tuple containing (similar_ratio, seed)
         
     Returns:
-        Dictionary containing single triplet data
+        Tuple of (anchor id, positive id, negative id, anchor status)
     """
-    similar_ratio, winning_projects, partial_projects, losing_projects = args
+    similar_ratio, seed = task
+    # Seeding per task keeps forked workers from drawing identical
+    # sequences and makes the output independent of scheduling
+    random.seed(seed)
+    winning_projects, partial_projects, losing_projects = _groups
     
     # Select category with focus on winning/losing
     category = random.choices(
@@ -39,12 +65,12 @@ def generate_single_triplet(args):
         # Decide between similar or random positive
         if random.random() < similar_ratio:
             similar_winning = cached_get_similar(
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
                 "big",
             )
             filtered_similar = filter_anchor_from_similar(
                 similar_winning,
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
             )
             if filtered_similar:
                 positive = random.choice(filtered_similar)
@@ -57,12 +83,12 @@ def generate_single_triplet(args):
         name_to_sample_from = "small" if random.random() < 0.5 else "none"
         if random.random() < similar_ratio:
             similar_losing = cached_get_similar(
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
                 name_to_sample_from,
             )
             filtered_similar = filter_anchor_from_similar(
                 similar_losing,
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
             )
             negative = random.choice(filtered_similar) if filtered_similar else random.choice(
                 [p for p in negative_to_sample_from if p != anchor]
@@ -74,12 +100,12 @@ def generate_single_triplet(args):
         anchor = random.choice(losing_projects)
         if random.random() < similar_ratio:
             similar_losing = cached_get_similar(
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
                 "none",
             )
             filtered_similar = filter_anchor_from_similar(
                 similar_losing,
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
             )
             positive = random.choice(filtered_similar) if filtered_similar else random.choice(
                 [p for p in losing_projects if p != anchor]
@@ -91,12 +117,12 @@ def generate_single_triplet(args):
         name_to_sample_from = "big" if random.random() < 0.5 else "small"
         if random.random() < similar_ratio:
             similar_winning = cached_get_similar(
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
                 name_to_sample_from,
             )
             filtered_similar = filter_anchor_from_similar(
                 similar_winning,
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
             )
             negative = random.choice(filtered_similar) if filtered_similar else random.choice(
                 [p for p in negative_to_sample_from if p != anchor]
@@ -108,12 +134,12 @@ def generate_single_triplet(args):
         anchor = random.choice(partial_projects)
         if random.random() < similar_ratio:
             similar_partial = cached_get_similar(
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
                 "small",
             )
             filtered_similar = filter_anchor_from_similar(
                 similar_partial,
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
             )
             positive = random.choice(filtered_similar) if filtered_similar else random.choice(
                 [p for p in partial_projects if p != anchor]
@@ -125,12 +151,12 @@ def generate_single_triplet(args):
         name_to_sample_from = "big" if random.random() < 0.5 else "none"
         if random.random() < similar_ratio:
             similar_other = cached_get_similar(
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
                 name_to_sample_from,
             )
             filtered_similar = filter_anchor_from_similar(
                 similar_other,
-                anchor["parsed_content"]["description_markdown"],
+                anchor["description"],
             )
             negative = random.choice(filtered_similar) if filtered_similar else random.choice(
                 [p for p in negative_to_sample_from if p != anchor]
@@ -138,44 +164,53 @@ def generate_single_triplet(args):
         else:
             negative = random.choice(negative_to_sample_from)
 
-    return {
-        "anchor": anchor["parsed_content"]["description_markdown"],
-        "positive": positive["parsed_content"]["description_markdown"],
-        "negative": negative["parsed_content"]["description_markdown"],
-        "anchor_status": category
-    }
+    return anchor["id"], positive["id"], negative["id"], category
 
 def filter_anchor_from_similar(similar_projects, anchor_text):
     """Filter out the anchor project from similar projects list."""
     return [
         id_to_doc[p.metadata["id"]]
         for p, _score in similar_projects
-        if id_to_doc[p.metadata["id"]]["parsed_content"]["description_markdown"] != anchor_text
+        if id_to_doc[p.metadata["id"]]["description"] != anchor_text
     ]
 
+def iter_triplets_parallel(
+    num_samples: int,
+    groups: Tuple[List[Dict], List[Dict], List[Dict]],
+    seed: str,
+    similar_ratio: float = 0.7,
+    num_processes: int = None
+) -> Iterator[Tuple[Dict, Dict, Dict, str]]:
+    """
+    Generate triplets in parallel using multiple processes, yielding
+    (anchor, positive, negative, anchor status) in order as they complete.
+    """
+    tasks = ((similar_ratio, f"{seed}-{i}") for i in range(num_samples))
+    with mp.Pool(processes=num_processes, initializer=init_worker, initargs=(groups,)) as pool:
+        for anchor, positive, negative, category in pool.imap(
+            generate_single_triplet, tasks, chunksize=16
+        ):
+            yield id_to_doc[anchor], id_to_doc[positive], id_to_doc[negative], category
+
 def generate_triplets_parallel(
     num_samples: int,
     winning_projects: List[Dict],
     partial_projects: List[Dict],
     losing_projects: List[Dict],
     similar_ratio: float = 0.7,
-    num_processes: int = None
+    num_processes: int = None,
+    seed: str = "0",
 ) -> Dict[str, List[str]]:
     """
     Generate triplets in parallel using multiple processes.
     """
-    # Create the exact number of tasks we need
-    args_list = [(similar_ratio, winning_projects, partial_projects, losing_projects) 
-                 for _ in range(num_samples)]
-    
-    # Create pool of workers
-    with mp.Pool(processes=num_processes) as pool:
-        # Process triplets in parallel with progress bar
-        results = list(tqdm(
-            pool.imap(generate_single_triplet, args_list),
-            total=num_samples,
-            desc="Generating triplets"
-        ))
+    triplets = iter_triplets_parallel(
+        num_samples,
+        (winning_projects, partial_projects, losing_projects),
+        seed,
+        similar_ratio,
+        num_processes,
+    )
     
     # Combine results
     combined_results = {
@@ -185,11 +220,13 @@ def generate_triplets_parallel(
         "anchor_status": []
     }
     
-    for result in results:
-        combined_results["anchor"].append(result["anchor"])
-        combined_results["positive"].append(result["positive"])
-        combined_results["negative"].append(result["negative"])
-        combined_results["anchor_status"].append(result["anchor_status"])
+    for anchor, positive, negative, category in tqdm(
+        triplets, total=num_samples, desc="Generating triplets"
+    ):
+        combined_results["anchor"].append(anchor["description"])
+        combined_results["positive"].append(positive["description"])
+        combined_results["negative"].append(negative["description"])
+        combined_results["anchor_status"].append(category)
     
     return combined_results
 
@@ -207,20 +244,17 @@ def create_triplet_dataset(
     random.seed(random_seed)
     np.random.seed(random_seed)
 
-    # Organize projects by win status
-    winning_projects = [p for p in projects if p["award"] == "big"]
-    partial_projects = [p for p in projects if p["award"] == "small"]
-    losing_projects = [p for p in projects if p["award"] == "none"]
+    groups = split_by_award(projects)
 
     # Generate splits in parallel
     train_data = generate_triplets_parallel(
-        num_train, winning_projects, partial_projects, losing_projects, num_processes=num_processes
+        num_train, *groups, num_processes=num_processes, seed=f"{random_seed}-train"
     )
     val_data = generate_triplets_parallel(
-        num_val, winning_projects, partial_projects, losing_projects, num_processes=num_processes
+        num_val, *groups, num_processes=num_processes, seed=f"{random_seed}-validation"
     )
     test_data = generate_triplets_parallel(
-        num_test, winning_projects, partial_projects, losing_projects, num_processes=num_processes
+        num_test, *groups, num_processes=num_processes, seed=f"{random_seed}-test"
     )
 
     # Create dataset dictionary
@@ -234,9 +268,51 @@ def create_triplet_dataset(
 
     return dataset_dict
 
+def export_triplet_dataset(
+    projects: List[Dict],
+    out_dir: str = triplet_export.OUT_DIR,
+    num_train: int = 20000,
+    num_val: int = 500,
+    num_test: int = 500,
+    random_seed: int = 42,
+    num_processes: int = 8,
+    ids_only: bool = False,
+) -> Dict:
+    """
+    Stream train/val/test triplets into sharded Parquet files under out_dir,
+    the same triplets create_triplet_dataset builds, without holding them in
+    memory. See triplet_export for the layout.
+    """
+    groups = split_by_award(projects)
+    splits = {
+        split: (
+            num_samples,
+            iter_triplets_parallel(
+                num_samples, groups, f"{random_seed}-{split}", num_processes=num_processes
+            ),
+        )
+        for split, num_samples in [
+            ("train", num_train), ("validation", num_val), ("test", num_test)
+        ]
+    }
+    return triplet_export.export(out_dir, splits, projects, ids_only=ids_only)
+
 if __name__ == "__main__":
-    projects = list(id_to_doc.values())
-    dataset = create_triplet_dataset(projects)
-    dataset.push_to_hub(
-        "jonathanli/hackathon-triplets-large-2",
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=triplet_export.OUT_DIR)
+    parser.add_argument(
+        "--ids-only",
+        action="store_true",
+        help="Store project ids instead of descriptions",
     )
+    parser.add_argument(
+        "--push",
+        metavar="REPO",
+        help="Also upload the export, e.g. to jonathanli/hackathon-triplets-large-2",
+    )
+    args = parser.parse_args()
+
+    projects = list(id_to_doc.values())
+    export_triplet_dataset(projects, args.out, ids_only=args.ids_only)
+    if args.push:
+        triplet_export.push(args.out, args.push)
@@ -1,33 +1,63 @@
-import cohere
-from tqdm import tqdm
+"""
+Classifies every award string in the corpus as a "Big Win" or "Small Win".
+
+Most awards are resolved locally: strings are normalized and deduplicated,
+then matched against RULES. Only the ambiguous remainder goes to the LLM,
+BATCH_SIZE awards per prompt, with the batches sent concurrently on one
+event loop.
+
+Results accumulate in output/awards_mapping.json (keyed by the raw award
+string, as build_vector_db.py reads it). A re-run only classifies awards
+that are not in it yet, and the file is rewritten after every batch so an
+interrupted run picks up where it stopped. Pass --refresh to start over.
+
+Finally each project's award class ("big" if any of its awards is a Big
+Win, else "small" if it has any award, else "none") is written as the
+corpus's award column.
+"""
+import argparse
+import asyncio
 import json
-import dotenv
 import os
-from multiprocessing import Pool, cpu_count
-from functools import partial
-
-def load_awards():
-    awards = set()
-    with open("output/projects_parsed_deduped.jsonl", "r") as file:
-        for line in file:
-            data = json.loads(line)
-            for sub in data["parsed_content"]["submissions"]:
-                awards.update(sub["awards"])
-    return list(awards)
-
-def process_award(award, api_key, base_url):
-    # Create a new client for each process to avoid sharing connections
-    co = cohere.Client(
-        api_key=api_key,
-        base_url=base_url,
-    )
-    
-    res = co.chat(
-        model="command-r-plus-08-2024",
-        message=award,
-        temperature=0,
-        chat_history=[
-            {"role": "system", "message": """You are tasked with classifying a list of hackathon prizes into two categories: Big Wins and Small Wins.
+import re
+import unicodedata
+
+import cohere
+import dotenv
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from tqdm import tqdm
+
+import corpus
+import upstream
+
+MAPPING_PATH = "output/awards_mapping.json"
+MODEL = "command-r-plus-08-2024"
+BATCH_SIZE = 25
+
+BIG, SMALL = "Big Win", "Small Win"
+
+PLACE = r"(?:\d+(?:st|nd|rd|th)|first|second|third|fourth|fifth|top \d+)"
+
+# Checked in order against the normalized string; the first match wins and a
+# None label sends the award to the LLM.
+# Sponsor and challenge markers come first: a placement in a sponsor's
+# challenge is still a small win.
+RULES = [
+    (re.compile(r"\bmlh\b|major league hacking"), SMALL),
+    (re.compile(r"\bbest use of\b|\bbest (?:\w+ ){0,3}(?:api|sdk)\b"), SMALL),
+    (re.compile(r"\b(?:sponsored|powered|presented) by\b"), SMALL),
+    (re.compile(r"\bhonou?rable mention\b"), SMALL),
+    (re.compile(r"\b(?:track|challenge|category|sponsor)\b"), None),
+    (re.compile(rf"^(?:overall )?{PLACE}(?: place)?(?: overall)?(?: winner)?$"), BIG),
+    (re.compile(rf"^(?:overall )?{PLACE} place (?:prize|winner)$"), BIG),
+    (re.compile(r"^(?:overall |grand prize |top \d+ )?(?:finalist|winner)s?$"), BIG),
+    (re.compile(r"^(?:overall )?grand prize(?: winner)?$"), BIG),
+    (re.compile(r"^best overall(?: hack| project)?$"), BIG),
+]
+
+SYSTEM_PROMPT = """You are tasked with classifying a list of hackathon prizes into two categories: Big Wins and Small Wins.
 
 Criteria for Classifying the Prizes:
 
@@ -38,44 +68,147 @@ Big wins should NOT be for a specific challenge. Big wins should not include ANY
 Example of big wins: Overall 1st place, 2nd place, or 3rd. Overall finalist. Any specified place should be considered a big win (e.g. 4th place, 5th place, etc.)
 Example of small wins: Any MLH prize, any prize specifically for using a technology.
 
-Instructions: Classify each prompt inputted as either a "Big Win" or "Small Win" based on the criteria provided, with a priority given to overall winners or finalists as large prizes."""}
-        ],
-        prompt_truncation="AUTO",
-        connectors=[],
+Instructions: You will be given a numbered list of prizes, one per line. Classify each as either a "Big Win" or "Small Win" based on the criteria provided, with a priority given to overall winners or finalists as large prizes. Answer with one line per prize, in the same order, formatted as "<number>: Big Win" or "<number>: Small Win", and nothing else."""
+
+_answer = re.compile(r"^\W*(\d+)\W+(big|small) win", re.I | re.M)
+
+
+def normalize(award):
+    award = unicodedata.normalize("NFKC", award).casefold()
+    return " ".join(re.sub(r"[^\w'&+#.]+", " ", award).split()).strip(" .")
+
+
+def classify_by_rules(normalized):
+    """Returns BIG or SMALL, or None when the award needs the LLM."""
+    for pattern, label in RULES:
+        if pattern.search(normalized):
+            return label
+    return None
+
+
+def load_awards(awards):
+    """Distinct award strings in the corpus's awards column."""
+    return sorted(pc.unique(pc.list_flatten(awards)).to_pylist())
+
+
+def award_classes(awards, mapping):
+    """Award class of each row, given its list of awards."""
+    awards = awards.combine_chunks()
+    flat = pc.list_flatten(awards)
+    rows = pc.list_parent_indices(awards).to_numpy()
+    distinct = pc.unique(flat)
+    big = np.array([mapping[a] == BIG for a in distinct.to_pylist()], dtype=bool)
+    is_big = big[pc.index_in(flat, distinct).to_numpy()]
+    has_award = np.bincount(rows, minlength=len(awards)) > 0
+    has_big = np.bincount(rows[is_big], minlength=len(awards)) > 0
+    classes = np.where(has_big, "big", np.where(has_award, "small", "none"))
+    return pa.array(classes).dictionary_encode()
+
+
+def load_mapping(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_mapping(mapping, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(mapping, f)
+    os.replace(tmp, path)
+
+
+def parse_answers(text, batch):
+    labels = {}
+    for number, label in _answer.findall(text):
+        i = int(number) - 1
+        if 0 <= i < len(batch):
+            labels[batch[i]] = BIG if label.lower() == "big" else SMALL
+    if len(batch) == 1 and not labels:
+        labels[batch[0]] = BIG if "big win" in text.lower() else SMALL
+    return labels
+
+
+async def classify_batch(co, batch):
+    message = "\n".join(f"{i}. {award}" for i, award in enumerate(batch, 1))
+    async with upstream.cohere.async_slot():
+        res = await co.chat(
+            model=MODEL,
+            message=message,
+            temperature=0,
+            chat_history=[{"role": "system", "message": SYSTEM_PROMPT}],
+            prompt_truncation="AUTO",
+            connectors=[],
+        )
+    return batch, parse_answers(res.text, batch)
+
+
+async def classify_with_llm(awards, on_batch):
+    """Classifies normalized awards in batches; awards missing from a batch's
+    answer are retried one at a time."""
+    co = cohere.AsyncClient(
+        api_key=os.getenv("COHERE_API_KEY"),
+        base_url=os.getenv("COHERE_BASE_URL", "https://stg.api.cohere.com/"),
+        timeout=upstream.cohere.timeout,
+        httpx_client=upstream.cohere.async_client(),
     )
-    
-    return award, "Big Win" if "big win" in res.text.lower() else "Small Win"
+    batches = [awards[i : i + BATCH_SIZE] for i in range(0, len(awards), BATCH_SIZE)]
+    try:
+        with tqdm(total=len(awards), desc="Classifying with LLM") as progress:
+            while batches:
+                missed = []
+                for done in asyncio.as_completed(
+                    [classify_batch(co, batch) for batch in batches]
+                ):
+                    batch, labels = await done
+                    on_batch(labels)
+                    progress.update(len(labels))
+                    missed.extend(a for a in batch if a not in labels)
+                batches = [[award] for award in missed]
+    finally:
+        await upstream.aclose()
+
 
 def main():
-    # Load environment variables
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--refresh", action="store_true", help="Ignore the existing mapping"
+    )
+    args = parser.parse_args()
     dotenv.load_dotenv()
-    api_key = os.getenv("COHERE_API_KEY")
-    base_url = "https://stg.api.cohere.com/"
-    
-    # Load awards
-    awards = load_awards()
-    
-    # Determine optimal number of processes (use 75% of available CPU cores)
-    num_processes = 50
-    
-    # Create partial function with fixed arguments
-    process_award_partial = partial(process_award, api_key=api_key, base_url=base_url)
-    
-    # Create process pool and map awards to processes
-    with Pool(num_processes) as pool:
-        # Use tqdm to show progress
-        results = list(tqdm(
-            pool.imap(process_award_partial, awards),
-            total=len(awards),
-            desc="Processing awards"
-        ))
-    
-    # Convert results to dictionary
-    awards_mapping = dict(results)
-    
-    # Save results
-    with open("output/awards_mapping.json", "w") as f:
-        json.dump(awards_mapping, f)
+
+    table = corpus.read(["id", "awards"])
+    mapping = {} if args.refresh else load_mapping(MAPPING_PATH)
+    known = {normalize(award): label for award, label in mapping.items()}
+
+    new_awards = [a for a in load_awards(table["awards"]) if a not in mapping]
+    unresolved = {}
+    for award in new_awards:
+        key = normalize(award)
+        label = known.get(key) or classify_by_rules(key)
+        if label:
+            mapping[award] = known[key] = label
+        else:
+            unresolved.setdefault(key, []).append(award)
+    local = len(new_awards) - sum(map(len, unresolved.values()))
+    print(
+        f"{len(new_awards)} new awards, {local} resolved locally, "
+        f"{len(unresolved)} distinct left for the LLM"
+    )
+
+    def on_batch(labels):
+        for key, label in labels.items():
+            for award in unresolved[key]:
+                mapping[award] = label
+        save_mapping(mapping, MAPPING_PATH)
+
+    save_mapping(mapping, MAPPING_PATH)
+    if unresolved:
+        asyncio.run(classify_with_llm(list(unresolved), on_batch))
+
+    corpus.write_column("award", table["id"], award_classes(table["awards"], mapping))
+
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,216 @@
+"""
+Removes duplicate projects from the scraped corpus.
+
+Exact duplicates (the same project_url scraped twice) keep the latest
+record, and projects with an empty description are dropped. Near
+duplicates, the same writeup reposted under a new slug or resubmitted to
+another hackathon, are found with MinHash over word shingles of the
+description and LSH banding:
+
+  - each description becomes NUM_PERM minimum hashes of its SHINGLE-word
+    shingles, so two signatures agree in a fraction of places that
+    estimates the Jaccard similarity of the shingle sets
+  - signatures are cut into BANDS bands; projects sharing any band
+    become candidates, which costs one sort per band instead of comparing
+    every pair
+  - candidates whose estimated similarity reaches THRESHOLD are merged
+
+Each cluster keeps one canonical record (a winner if there is one, then
+the longest description) with the submissions and awards of all its
+members, and the other members' URLs under "duplicate_urls". The result
+is the Parquet corpus every later stage reads (see corpus.py).
+
+The input is read twice as a stream: once for signatures, which is all
+that stays in memory, and once to write the output.
+"""
+import argparse
+import hashlib
 import json
+import re
+
+import numpy as np
+from tqdm import tqdm
+
+import corpus
+
+NUM_PERM = 128
+BANDS = 16
+SHINGLE = 5
+THRESHOLD = 0.8
+# Descriptions shorter than this many shingles are mostly Devpost's section
+# template and would look alike regardless of the project
+MIN_SHINGLES = 20
+
+_rng = np.random.default_rng(0)
+_perm_a = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64)[:, None] * 2 + 1
+_perm_b = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)[:, None]
+_shingle_weights = np.array(
+    [pow(0x100000001B3, SHINGLE - 1 - i, 2**64) for i in range(SHINGLE)],
+    dtype=np.uint64,
+)
+_band_weights = _rng.integers(1, 2**63, NUM_PERM // BANDS, dtype=np.uint64) * 2 + 1
+_token = re.compile(r"\w+")
+_token_hashes = {}
+
+
+def token_hash(token):
+    h = _token_hashes.get(token)
+    if h is None:
+        h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest())
+        _token_hashes[token] = h
+    return h
+
+
+def shingle_hashes(text):
+    tokens = np.array(
+        [token_hash(t) for t in _token.findall(text.lower())], dtype=np.uint64
+    )
+    n = len(tokens) - SHINGLE + 1
+    if n <= 0:
+        return tokens[:0]
+    windows = [tokens[i : i + n] * w for i, w in enumerate(_shingle_weights)]
+    return np.unique(np.sum(windows, axis=0, dtype=np.uint64))
+
+
+def signature(text):
+    """MinHash signature of the text's shingles, or None if it is too short."""
+    shingles = shingle_hashes(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    # Multiply-shift hashing: one cheap universal hash per permutation
+    hashed = (_perm_a * shingles[None, :] + _perm_b) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def candidate_pairs(signatures):
+    """Pairs of rows sharing at least one LSH band, each bucket paired
+    against its first row."""
+    rows_per_band = NUM_PERM // BANDS
+    pairs = []
+    for band in range(BANDS):
+        part = signatures[:, band * rows_per_band : (band + 1) * rows_per_band]
+        keys = (part.astype(np.uint64) * _band_weights).sum(axis=1, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.concatenate([[True], keys[1:] != keys[:-1]])
+        heads = order[np.maximum.accumulate(np.where(starts, np.arange(len(keys)), 0))]
+        members = ~starts
+        pairs.append(np.stack([heads[members], order[members]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def similar_pairs(signatures, threshold=THRESHOLD, block=65536):
+    pairs = candidate_pairs(signatures)
+    keep = []
+    for start in range(0, len(pairs), block):
+        a, b = pairs[start : start + block].T
+        agreement = (signatures[a] == signatures[b]).mean(axis=1)
+        keep.append(pairs[start : start + block][agreement >= threshold])
+    return np.concatenate(keep) if keep else pairs
+
+
+def clusters(num_rows, pairs):
+    """Union-find over the pairs; returns each row's root."""
+    parent = np.arange(num_rows)
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    return np.array([find(x) for x in range(num_rows)])
+
+
+def merge(canonical, members):
+    """The canonical record with every member's submissions and awards."""
+    submissions = {}
+    for record in [canonical] + members:
+        for sub in record["parsed_content"]["submissions"]:
+            key = sub.get("url") or sub.get("name")
+            if key not in submissions:
+                submissions[key] = dict(sub, awards=list(sub["awards"]))
+            else:
+                awards = submissions[key]["awards"]
+                awards.extend(a for a in sub["awards"] if a not in awards)
+    merged = dict(canonical)
+    merged["parsed_content"] = dict(
+        canonical["parsed_content"], submissions=list(submissions.values())
+    )
+    merged["is_winner"] = any(r.get("is_winner") for r in [canonical] + members)
+    merged["duplicate_urls"] = [r["project_url"] for r in members]
+    return merged
+
+
+def read_signatures(path):
+    """First pass: the latest offset and a signature for every project URL."""
+    slots, offsets, signatures, ranks = {}, [], [], []
+    with open(path, "rb") as file, tqdm(desc="Signing", unit=" lines") as progress:
+        offset = 0
+        for line in file:
+            progress.update()
+            data = json.loads(line)
+            description = data["parsed_content"]["description_markdown"]
+            if description:
+                slot = slots.setdefault(data["project_url"], len(offsets))
+                if slot == len(offsets):
+                    offsets.append(0)
+                    signatures.append(None)
+                    ranks.append(None)
+                offsets[slot] = offset
+                signatures[slot] = signature(description)
+                ranks[slot] = (bool(data.get("is_winner")), len(description))
+            offset += len(line)
+    return offsets, signatures, ranks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="output/projects_parsed.jsonl")
+    parser.add_argument("--output", default=corpus.CORPUS_PATH)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    offsets, signatures, ranks = read_signatures(args.input)
+    signed = np.array([i for i, s in enumerate(signatures) if s is not None])
+    roots = np.arange(len(offsets))
+    if len(signed):
+        matrix = np.stack([signatures[i] for i in signed])
+        pairs = similar_pairs(matrix, args.threshold)
+        roots[signed] = signed[clusters(len(signed), pairs)]
+    del signatures
+
+    groups = {}
+    for row, root in enumerate(roots):
+        groups.setdefault(int(root), []).append(row)
+
+    with open(args.input, "rb") as src, corpus.Writer(args.output) as out:
+
+        def read(row):
+            src.seek(offsets[row])
+            return json.loads(src.readline())
+
+        for members in tqdm(groups.values(), desc="Writing"):
+            if len(members) == 1:
+                record = read(members[0])
+            else:
+                members.sort(key=lambda row: ranks[row], reverse=True)
+                record = merge(read(members[0]), [read(row) for row in members[1:]])
+            out.write(record)
 
-d = {}
-with open("output/projects_parsed_deduped.jsonl", "r") as file:
-    for line in file:
-        data = json.loads(line)
-        if data["parsed_content"]["description_markdown"] == "":
-            continue
+    written = out.num_rows
+    print(
+        f"{len(offsets)} unique URLs, {len(offsets) - written} near duplicates "
+        f"merged into {sum(len(m) > 1 for m in groups.values())} projects, "
+        f"{written} written to {args.output}"
+    )
 
-        d[data["project_url"]] = data
 
-with open("output/projects_parsed_final.jsonl", "w") as f:
-    for r in d.values():
-        f.write(json.dumps(r)+"\n")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Streams generated triplets to sharded Parquet files on disk.
+
+The builders used to hold every split in Python lists, convert them with
+Dataset.from_dict and push to the Hub, which needs the whole dataset in
+memory and a network connection. export() instead writes each triplet as it
+is produced: rows are flushed every BATCH_ROWS as a row group and a new
+shard is started every SHARD_ROWS, so memory stays flat however many
+triplets are built.
+
+Layout of an export directory:
+    <split>-00000.parquet ...   anchor, positive, negative, anchor_status
+    projects.parquet            id, description; only with ids_only
+    manifest.json               splits, their shards and row counts
+
+With ids_only the rows hold project ids (anchor_id, positive_id,
+negative_id) instead of repeating the full markdown three times per row,
+and the descriptions are stored once in projects.parquet.
+
+The export can be pushed to the Hub later, from any machine with the files:
+
+    python -m build_data.triplet_export push output/triplets <repo>
+
+ids are resolved back to text on the way up.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+OUT_DIR = "output/triplets"
+SHARD_ROWS = 100000
+BATCH_ROWS = 2000
+ROLES = ["anchor", "positive", "negative"]
+
+TEXT_SCHEMA = pa.schema(
+    [(role, pa.large_string()) for role in ROLES] + [("anchor_status", pa.string())]
+)
+ID_SCHEMA = pa.schema(
+    [(f"{role}_id", pa.string()) for role in ROLES] + [("anchor_status", pa.string())]
+)
+
+
+class ShardWriter:
+    def __init__(self, out_dir, split, schema, shard_rows=SHARD_ROWS):
+        self.out_dir = out_dir
+        self.split = split
+        self.schema = schema
+        self.shard_rows = shard_rows
+        self.files = []
+        self.num_rows = 0
+        self._rows = []
+        self._writer = None
+        self._shard_size = 0
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        while self._rows:
+            if self._writer is None:
+                name = f"{self.split}-{len(self.files):05d}.parquet"
+                path = os.path.join(self.out_dir, name)
+                self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+                self.files.append(name)
+            take = min(len(self._rows), self.shard_rows - self._shard_size)
+            rows, self._rows = self._rows[:take], self._rows[take:]
+            self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+            self.num_rows += take
+            self._shard_size += take
+            if self._shard_size >= self.shard_rows:
+                self._writer.close()
+                self._writer, self._shard_size = None, 0
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+        return {"rows": self.num_rows, "files": self.files}
+
+
+def export(out_dir, splits, projects, ids_only=False, shard_rows=SHARD_ROWS):
+    """
+    Writes each split's triplets to `out_dir`, replacing a previous export.
+
+    Args:
+        splits: {split name: (number of triplets, iterator of
+            (anchor, positive, negative, anchor_status))}, where the three
+            projects are dicts with "id" and "description"
+        projects: every project a triplet can refer to, for projects.parquet
+        ids_only: store project ids instead of descriptions
+    """
+    tmp_dir = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    manifest = {"ids_only": ids_only, "splits": {}}
+    key = "id" if ids_only else "description"
+    columns = ID_SCHEMA.names if ids_only else TEXT_SCHEMA.names
+
+    for split, (num_samples, triplets) in splits.items():
+        writer = ShardWriter(
+            tmp_dir, split, ID_SCHEMA if ids_only else TEXT_SCHEMA, shard_rows
+        )
+        for *members, status in tqdm(triplets, total=num_samples, desc=split):
+            writer.write(dict(zip(columns, [p[key] for p in members] + [status])))
+        manifest["splits"][split] = writer.close()
+
+    if ids_only:
+        manifest["projects"] = "projects.parquet"
+        table = pa.Table.from_pylist(
+            [{"id": p["id"], "description": p["description"]} for p in projects],
+            schema=pa.schema([("id", pa.string()), ("description", pa.large_string())]),
+        )
+        pq.write_table(table, os.path.join(tmp_dir, "projects.parquet"))
+
+    # The manifest goes last, so a complete one means a complete export
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+    return manifest
+
+
+def push(out_dir, repo_id):
+    """Uploads an export to the Hub as a DatasetDict with text columns."""
+    from datasets import load_dataset
+
+    with open(os.path.join(out_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    data_files = {
+        split: [os.path.join(out_dir, name) for name in info["files"]]
+        for split, info in manifest["splits"].items()
+    }
+    dataset = load_dataset("parquet", data_files=data_files)
+
+    if manifest["ids_only"]:
+        table = pq.read_table(os.path.join(out_dir, manifest["projects"]))
+        texts = dict(zip(table["id"].to_pylist(), table["description"].to_pylist()))
+
+        def resolve(batch):
+            return {role: [texts[i] for i in batch[f"{role}_id"]] for role in ROLES}
+
+        dataset = dataset.map(
+            resolve,
+            batched=True,
+            remove_columns=[f"{role}_id" for role in ROLES],
+        ).select_columns(TEXT_SCHEMA.names)
+
+    dataset.push_to_hub(repo_id)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    push_parser = commands.add_parser("push", help="Upload an export to the Hub")
+    push_parser.add_argument("out_dir")
+    push_parser.add_argument("repo_id")
+    args = parser.parse_args()
+    push(args.out_dir, args.repo_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,48 +12,87 @@ from langchain_community.document_loaders import WebBaseLoader
 import dotenv
 
 from langchain_core.documents import Document
+import numpy as np
+import pyarrow as pa
+
+import corpus
+from chunking import chunk
+from mmap_store import MmapIndex, export_from_chroma
+from similar_to_others import publish, snapshots_dir
 
 import os
+import shutil
+import time
 
 dotenv.load_dotenv()
 
 api_key = os.getenv("COHERE_API_KEY")
 
+# With FLIGHTDECK_CHUNKED=1 each description is embedded as section-aware
+# chunks instead of one (truncated) document; search scores a project by its
+# best chunk.
+chunked = os.getenv("FLIGHTDECK_CHUNKED") == "1"
+
 embeddings = CohereEmbeddings(cohere_api_key=api_key,
-                                base_url="https://stg.api.cohere.com/",
+                                base_url=os.getenv("COHERE_BASE_URL", "https://stg.api.cohere.com/"),
                               model="embed-english-v3.0")
 
 # Load text files and split into chunks, you can also use data gathered elsewhere in your application
 documents = []
 project_id_to_data = {}
-award_mapping = json.load(open("output/awards_mapping.json", "r"))
-with open("output/projects_parsed_deduped.jsonl", "r") as file:
-    for line in file:
-        data = json.loads(line)
-        id_data = str(uuid.uuid4())
-        awards = []
-        for sub in data["parsed_content"]["submissions"]:
-            for award in sub["awards"]:
-                awards.append(award_mapping[award])
-        
-        award = "none"
-        if "Big Win" in awards:
-            award = "big"
-        elif "Small Win" in awards:
-            award = "small"
-        
-        data["award"] = award
-
+table = corpus.read(["id", "description", "award", "record"])
+ids = table["id"].to_pylist()
+for id_data, description, award, data in zip(
+    ids,
+    table["description"].to_pylist(),
+    table["award"].to_pylist(),
+    corpus.records(table),
+):
+    data["award"] = award
+    for text in chunk(description) if chunked else [description]:
         documents.append(Document(
-            data["parsed_content"]["description_markdown"],
+            text,
             metadata={"id": id_data, "award": award}
         ))
-        
-        project_id_to_data[id_data] = data
+
+    project_id_to_data[id_data] = data
+
+# Each build goes to its own snapshot directory; running API servers switch
+# to it without a restart once it is published.
+version = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+snapshot_root = os.path.join(snapshots_dir, version)
+os.makedirs(snapshot_root)
 
 json.dump(project_id_to_data, open("output/project_id_to_data.json", "w"))
+shutil.copy(
+    "output/project_id_to_data.json",
+    os.path.join(snapshot_root, "project_id_to_data.json"),
+)
 db = Chroma.from_documents(
     documents,
     embeddings,
-    persist_directory="./chroma_langchain_db"
+    persist_directory=os.path.join(snapshot_root, "chroma_langchain_db")
 )
+
+# Read-only copy for serving with FLIGHTDECK_INDEX=mmap
+export_from_chroma(
+    db, project_id_to_data, os.path.join(snapshot_root, "index_snapshot")
+)
+
+# One vector per project for the corpus's embedding column, in corpus order;
+# a chunked project gets the normalized mean of its chunks
+index = MmapIndex(os.path.join(snapshot_root, "index_snapshot"))
+vectors = np.asarray(index.vectors)
+if index.chunk_offsets is not None:
+    vectors = np.add.reduceat(vectors, index.chunk_offsets[:-1], axis=0)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+rows = np.searchsorted(index.ids, np.array(ids, dtype="S36"))
+corpus.write_column(
+    "embedding",
+    table["id"],
+    pa.FixedSizeListArray.from_arrays(
+        vectors[rows].astype(np.float32).ravel(), vectors.shape[1]
+    ),
+)
+
+publish(version)
@@ -0,0 +1,70 @@
+"""
+Section-aware splitting of project writeups for embedding.
+
+The embedder truncates long inputs (embed-english-v3.0 reads 512 tokens), so
+anything past the first couple of thousand characters of a writeup is lost.
+chunk() splits markdown at its headings and packs whole sections into chunks
+of at most MAX_CHARS. A section too long for one chunk is split at paragraph
+breaks (or, failing that, every MAX_CHARS characters) and each piece keeps
+the section's heading for context.
+
+FLIGHTDECK_CHUNK_CHARS overrides the chunk size.
+"""
+import os
+import re
+
+MAX_CHARS = int(os.getenv("FLIGHTDECK_CHUNK_CHARS", "1500"))
+
+_heading = re.compile(r"^(?=#{1,6}\s)", re.M)
+_paragraph_break = re.compile(r"\n\s*\n")
+
+
+def sections(markdown):
+    return [s.strip() for s in _heading.split(markdown) if s.strip()]
+
+
+def split_section(section, max_chars):
+    heading = ""
+    first_line, _, rest = section.partition("\n")
+    if first_line.startswith("#") and len(first_line) < max_chars // 2:
+        heading, section = first_line, rest
+
+    budget = max_chars - len(heading) - 2
+    paragraphs = []
+    for paragraph in _paragraph_break.split(section):
+        paragraph = paragraph.strip()
+        while len(paragraph) > budget:
+            paragraphs.append(paragraph[:budget])
+            paragraph = paragraph[budget:]
+        if paragraph:
+            paragraphs.append(paragraph)
+
+    pieces = pack(paragraphs, budget)
+    if heading:
+        pieces = [heading + "\n\n" + piece for piece in pieces] or [heading]
+    return pieces
+
+
+def pack(parts, max_chars):
+    """Joins consecutive parts into as few strings of at most max_chars as fit."""
+    packed = []
+    for part in parts:
+        if packed and len(packed[-1]) + 2 + len(part) <= max_chars:
+            packed[-1] += "\n\n" + part
+        else:
+            packed.append(part)
+    return packed
+
+
+def chunk(markdown, max_chars=None):
+    """Splits markdown into chunks of at most max_chars; always at least one."""
+    max_chars = max_chars or MAX_CHARS
+    if len(markdown) <= max_chars:
+        return [markdown]
+    pieces = []
+    for section in sections(markdown):
+        if len(section) <= max_chars:
+            pieces.append(section)
+        else:
+            pieces.extend(split_section(section, max_chars))
+    return pack(pieces, max_chars) or [markdown[:max_chars]]
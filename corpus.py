@@ -0,0 +1,156 @@
+"""
+The canonical project corpus, a Parquet file read by every build stage.
+
+The dedup stage writes output/corpus.parquet once per scrape, one row per
+project, with typed columns so later stages load only what they need
+instead of parsing every JSON record:
+
+    id             project id, a uuid5 of the project URL (stable across builds)
+    url, title, tagline, thumbnail_url
+    likes, comments, is_winner
+    description    the writeup as markdown
+    built_with     list of technologies
+    hackathons     list of hackathon names, one per submission
+    awards         list of award strings across all submissions
+    record         the full scraped record as JSON
+
+Columns computed by later stages go in sidecar files next to the corpus,
+row-aligned with it, so no stage rewrites another stage's output:
+
+    award          "big", "small" or "none"; corpus.award.parquet, written
+                   by classify_prizes
+    embedding      per-project vector; corpus.embedding.parquet, written by
+                   build_vector_db
+
+The files are zstd-compressed, so whatever is read is decompressed into
+memory. read() only reads the columns it is asked for, so a stage that
+needs a few columns does not read or decompress the others; the
+descriptions and full records make up most of the file.
+"""
+import json
+import os
+import uuid
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CORPUS_PATH = "output/corpus.parquet"
+BATCH_ROWS = 10000
+
+SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("url", pa.string()),
+        ("title", pa.string()),
+        ("tagline", pa.string()),
+        ("thumbnail_url", pa.string()),
+        ("likes", pa.int32()),
+        ("comments", pa.int32()),
+        ("is_winner", pa.bool_()),
+        ("description", pa.large_string()),
+        ("built_with", pa.list_(pa.string())),
+        ("hackathons", pa.list_(pa.string())),
+        ("awards", pa.list_(pa.string())),
+        ("record", pa.large_string()),
+    ]
+)
+SIDECARS = ["award", "embedding"]
+
+
+def project_id(url):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+
+
+def sidecar_path(name, path=CORPUS_PATH):
+    return f"{os.path.splitext(path)[0]}.{name}.parquet"
+
+
+def to_row(record, id=None):
+    content = record["parsed_content"]
+    submissions = content.get("submissions", [])
+    return {
+        "id": id or project_id(record["project_url"]),
+        "url": record["project_url"],
+        "title": record.get("title"),
+        "tagline": record.get("tagline"),
+        "thumbnail_url": record.get("thumbnail_url"),
+        "likes": record.get("likes"),
+        "comments": record.get("comments"),
+        "is_winner": record.get("is_winner"),
+        "description": content.get("description_markdown", ""),
+        "built_with": content.get("built_with", []),
+        "hackathons": [s.get("name") for s in submissions],
+        "awards": [a for s in submissions for a in s["awards"]],
+        "record": json.dumps(record, ensure_ascii=False),
+    }
+
+
+class Writer:
+    """Streams records into a new corpus, replacing the old one on close."""
+
+    def __init__(self, path=CORPUS_PATH, batch_rows=BATCH_ROWS):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.rows = []
+        self.num_rows = 0
+        self._tmp = path + ".tmp"
+        self._writer = pq.ParquetWriter(self._tmp, SCHEMA, compression="zstd")
+
+    def write(self, record, id=None):
+        self.rows.append(to_row(record, id))
+        if len(self.rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self._writer.write_table(pa.Table.from_pylist(self.rows, schema=SCHEMA))
+            self.num_rows += len(self.rows)
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            os.remove(self._tmp)
+
+
+def write_column(name, ids, values, path=CORPUS_PATH):
+    """Writes a sidecar column; `ids` is the corpus id column it lines up with."""
+    tmp = sidecar_path(name, path) + ".tmp"
+    pq.write_table(pa.table({"id": ids, name: values}), tmp, compression="zstd")
+    os.replace(tmp, sidecar_path(name, path))
+
+
+def read(columns=None, path=CORPUS_PATH):
+    """Loads the named columns, base and sidecar alike, as one pyarrow Table."""
+    columns = list(columns or SCHEMA.names)
+    base = [c for c in columns if c not in SIDECARS]
+    sidecars = [c for c in columns if c in SIDECARS]
+    if sidecars and "id" not in base:
+        base.append("id")
+    table = pq.read_table(path, columns=base, memory_map=True)
+    for name in sidecars:
+        side = pq.read_table(sidecar_path(name, path), memory_map=True)
+        if not side["id"].equals(table["id"]):
+            raise ValueError(
+                f"{sidecar_path(name, path)} does not match {path}; "
+                f"rebuild the stage that writes the {name} column"
+            )
+        table = table.append_column(name, side[name])
+    return table.select(columns)
+
+
+def records(table):
+    """The full scraped records of the rows in `table` (needs "record")."""
+    for batch in table.select(["record"]).to_batches():
+        for record in batch.column(0).to_pylist():
+            yield json.loads(record)
@@ -0,0 +1,144 @@
+"""
+Local win-likelihood scoring from the index's own embeddings; no LLM call.
+
+Two signals per document, both computed from vectors already in the
+snapshot:
+
+  probabilities  a softmax regression head over the project vectors, fitted
+                 to their award classes (none, small, big) when the snapshot
+                 is written; P(big) is the headline score
+  neighbors      how many of the k nearest projects are in each class
+
+The head is fitted in the top RANK principal directions of the project
+vectors: one pass over the vectors builds their Gram matrix, and gradient
+descent then runs on an (n, RANK) projection that fits in cache, so
+fitting takes seconds even for a large corpus. It is stored in the
+snapshot as win_head.npz; older snapshots without one get it fitted on
+load.
+
+score() takes a batch of query vectors and handles it with one matrix
+product against the head and one against the index.
+"""
+import os
+
+import numpy as np
+
+# Same order as the codes in awards.npy (mmap_store.AWARDS)
+CLASSES = ["none", "small", "big"]
+HEAD_FILE = "win_head.npz"
+K = 25
+RANK = 128
+L2 = 1e-4
+STEPS = 300
+
+
+def project_vectors(vectors, chunk_offsets=None):
+    """One unit vector per project: chunk vectors are averaged."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if chunk_offsets is not None:
+        vectors = np.add.reduceat(vectors, chunk_offsets[:-1], axis=0)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def fit_head(vectors, labels, rank=RANK, l2=L2, steps=STEPS):
+    """Softmax regression of labels (class codes) on vectors.
+
+    Returns (weights (dim, classes), bias (classes,), prior (classes,)).
+    """
+    n, dim = vectors.shape
+    targets = np.eye(len(CLASSES), dtype=np.float32)[labels]
+    prior = targets.mean(axis=0)
+
+    # Top principal directions of the (uncentred) vectors; the bias absorbs
+    # the mean
+    _, basis = np.linalg.eigh(vectors.T @ vectors)
+    basis = basis[:, ::-1][:, : min(rank, dim)].astype(np.float32)
+    features = np.hstack([vectors @ basis, np.ones((n, 1), dtype=np.float32)])
+
+    # Nesterov-accelerated gradient descent, step size from the curvature bound
+    curvature = np.linalg.norm(features, 2) ** 2 / n / 2 + l2
+    step = 1.0 / curvature
+    weights = np.zeros((features.shape[1], len(CLASSES)), dtype=np.float32)
+    weights[-1] = np.log(np.maximum(prior, 1e-6))
+    momentum = weights.copy()
+    for t in range(steps):
+        logits = features @ momentum
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        grad = features.T @ (probs - targets) / n
+        grad[:-1] += l2 * momentum[:-1]
+        updated = momentum - step * grad
+        momentum = updated + (t / (t + 3)) * (updated - weights)
+        weights = updated
+
+    return basis @ weights[:-1], weights[-1], prior
+
+
+def write_head(snapshot_dir, vectors, chunk_offsets, award_codes):
+    """Fits the head for a snapshot's vectors and stores it in the snapshot."""
+    weights, bias, prior = fit_head(
+        project_vectors(vectors, chunk_offsets), np.asarray(award_codes)
+    )
+    np.savez(os.path.join(snapshot_dir, HEAD_FILE), weights=weights, bias=bias, prior=prior)
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+class WinScorer:
+    def __init__(self, snapshot_dir):
+        def load(name):
+            return np.load(os.path.join(snapshot_dir, name), mmap_mode="r")
+
+        self.vectors = load("vectors.npy")
+        self.awards = np.asarray(load("awards.npy"))
+        self.chunk_offsets = None
+        if os.path.exists(os.path.join(snapshot_dir, "chunk_offsets.npy")):
+            self.chunk_offsets = np.asarray(load("chunk_offsets.npy"))
+
+        head_path = os.path.join(snapshot_dir, HEAD_FILE)
+        if os.path.exists(head_path):
+            with np.load(head_path) as head:
+                self.weights, self.bias = head["weights"], head["bias"]
+                self.prior = head["prior"]
+        else:
+            self.weights, self.bias, self.prior = fit_head(
+                project_vectors(self.vectors, self.chunk_offsets), self.awards
+            )
+
+    def probabilities(self, queries):
+        """(batch, classes) class probabilities for unit query vectors."""
+        return _softmax(queries @ self.weights + self.bias)
+
+    def neighbor_counts(self, queries, k=K):
+        """(batch, classes) award classes of each query's k nearest projects."""
+        similarity = queries @ self.vectors.T
+        if self.chunk_offsets is not None:
+            # A project is as close as its closest chunk
+            similarity = np.maximum.reduceat(similarity, self.chunk_offsets[:-1], axis=1)
+        k = min(k, similarity.shape[1])
+        if k == 0:
+            return np.zeros((len(queries), len(CLASSES)), dtype=np.int64)
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        codes = self.awards[nearest]
+        return (codes[:, :, None] == np.arange(len(CLASSES))).sum(axis=1)
+
+    def score(self, queries, k=K):
+        """Scores a batch of query embeddings; returns one dict per query."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        probs = self.probabilities(queries)
+        counts = self.neighbor_counts(queries, k)
+        big = CLASSES.index("big")
+        return [
+            {
+                "win_probability": float(p[big]),
+                "probabilities": dict(zip(CLASSES, p.tolist())),
+                "neighbors": dict(zip(CLASSES, c.tolist())),
+            }
+            for p, c in zip(probs, counts)
+        ]
@@ -0,0 +1,198 @@
+"""
+Response compression and entity tags.
+
+CompressionMiddleware encodes response bodies with brotli (when the brotli
+package is installed) or gzip, whichever the client accepts, preferring
+brotli. Bodies smaller than MINIMUM_SIZE are sent as is; streamed responses
+(NDJSON), whose size is not known up front, are always compressed, with a
+flush after every chunk so each event still reaches the client as soon as
+it is written.
+
+An encoded response is a different representation from the plain one, so a
+strong ETag gets the coding appended ("abc" becomes "abc-br"). matching_etag()
+ignores that suffix when it checks If-None-Match, so a client holding either
+variant gets its 304.
+"""
+import hashlib
+import zlib
+
+try:
+    import brotli
+
+    CODINGS = ["br", "gzip"]
+except ImportError:
+    brotli = None
+    CODINGS = ["gzip"]
+
+MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+# Brotli's high qualities are built for static assets; 5 is the lowest that
+# beats gzip on a typical /similar response, in under a millisecond
+BROTLI_QUALITY = 5
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+
+def negotiate(accept_encoding):
+    """The coding to use for an Accept-Encoding header value, or None."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    for coding in CODINGS:
+        if accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def etag(*parts):
+    """A strong entity tag for a response determined by parts."""
+    digest = hashlib.sha256("\0".join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def matching_etag(if_none_match, tag):
+    """The entity tag in an If-None-Match value that matches tag, or None.
+
+    Uses weak comparison, as RFC 9110 asks for If-None-Match, and ignores
+    the coding suffix CompressionMiddleware adds.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        opaque = candidate[2:] if candidate.startswith("W/") else candidate
+        for coding in CODINGS:
+            if opaque.endswith(f'-{coding}"'):
+                opaque = opaque[: -len(coding) - 2] + '"'
+                break
+        if opaque == tag:
+            return candidate
+    return None
+
+
+class _Encoder:
+    def __init__(self, coding):
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self.coding = coding
+
+    def chunk(self, data):
+        """Compressed data, flushed so the client can decode it right away."""
+        if self.coding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data=b""):
+        if self.coding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value
+        coding = negotiate(accept.decode("latin-1"))
+
+        start = None
+        encoder = None
+
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if encoder is None:
+                headers = _Headers(start["headers"])
+                headers.add_vary("Accept-Encoding")
+                compress = (
+                    coding is not None
+                    and start["status"] not in (204, 304)
+                    and headers.get("content-encoding") is None
+                    and (headers.get("content-type") or "").startswith(COMPRESSIBLE)
+                    and self._large_enough(headers, body, more)
+                )
+                if compress:
+                    encoder = _Encoder(coding)
+                    headers.remove("content-length")
+                    headers.set("content-encoding", coding)
+                    tag = headers.get("etag")
+                    if tag and tag.startswith('"'):
+                        headers.set("etag", f'{tag[:-1]}-{coding}"')
+                start["headers"] = headers.raw
+                await send(start)
+                if not compress:
+                    start = None
+                    await send(message)
+                    return
+
+            data = encoder.chunk(body) if more else encoder.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _large_enough(self, headers, body, more):
+        # Responses passed through BaseHTTPMiddleware arrive in chunks too, so
+        # a declared length decides; without one the response is a stream
+        length = headers.get("content-length")
+        if length is not None:
+            return int(length) >= self.minimum_size
+        return more or len(body) >= self.minimum_size
+
+
+class _Headers:
+    """Case-insensitive edits of an ASGI header list."""
+
+    def __init__(self, raw):
+        self.raw = list(raw)
+
+    def get(self, name):
+        key = name.encode("latin-1")
+        for k, v in self.raw:
+            if k.lower() == key:
+                return v.decode("latin-1")
+        return None
+
+    def remove(self, name):
+        key = name.encode("latin-1")
+        self.raw = [(k, v) for k, v in self.raw if k.lower() != key]
+
+    def set(self, name, value):
+        self.remove(name)
+        self.raw.append((name.encode("latin-1"), value.encode("latin-1")))
+
+    def add_vary(self, value):
+        vary = self.get("vary")
+        if vary is None:
+            self.set("vary", value)
+        elif value.lower() not in vary.lower():
+            self.set("vary", f"{vary}, {value}")
@@ -3,9 +3,10 @@
 /* eslint-disable @typescript-eslint/no-unused-vars */
 /* eslint-disable @next/next/no-html-link-for-pages */
 
-import { useState, FormEvent } from "react";
+import { useRef, useState, FormEvent } from "react";
 import dynamic from "next/dynamic";
-import { Project, SimilarityResult } from "@/lib/types";
+import { InsightsEvent, Project, SimilarityResult } from "@/lib/types";
+import { streamInsights } from "@/lib/insights";
 import Link from "next/link";
 import Markdown from "react-markdown";
 import { ArrowBigRight } from "lucide-react";
@@ -66,89 +67,46 @@ export default function Main() {
   const [suggestion, setSuggestions] = useState<string[]>([]);
   const [activeSuggestion, setActiveSuggestion] = useState<number>(0);
 
+  // Bumped by every search, so events still streaming in for an earlier
+  // search are dropped
+  const searchCount = useRef<number>(0);
+
   const handleSubmit = async (e: FormEvent<HTMLFormElement>) => {
     e.preventDefault();
     setError("");
     setSubmitted(true);
-
-    let data: SimilarityResult[] | null = null;
-    try {
-      const response = await fetch(`${baseUrl}/similar`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          document_or_link: input,
-          k: 3,
-          filter: { award: "big" },
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch similar projects");
-      }
-
-      data = (await response.json()) as SimilarityResult[];
-      setResults(data);
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred");
-    }
-
-    if (data === null) {
-      return;
-    }
-
-    try {
-      const response = await fetch(`${baseUrl}/what-they-did`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          documents: data.map(
-            ([, project]) => project.parsed_content.description_markdown
-          ),
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch what they did");
-      }
-
-      const d: string[] = await response.json();
-      setWhatTheyDid(d);
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred");
-    }
+    setResults([]);
+    setWhatTheyDid([]);
+    setHowTheyWon([]);
+    const search = ++searchCount.current;
 
     try {
-      const response = await fetch(`${baseUrl}/how-they-won`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          documents: data.map(
-            ([, project]) => project.parsed_content.description_markdown
-          ),
-          prizes: data.map(([, project]) =>
-            project.parsed_content.submissions
-              .map((submission) => submission.awards.join(", "))
-              .join(", ")
-          ),
-          names: data.map(([_, project]) => project.title),
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch how they won");
-      }
-
-      const d = await response.json();
-
-      setHowTheyWon(d);
+      let ids: string[] = [];
+      await streamInsights(
+        `${baseUrl}/project-insights`,
+        { document_or_link: input, k: 3, filter: { award: "big" } },
+        {},
+        () => search === searchCount.current,
+        (event: InsightsEvent) => {
+          if (event.type === "similar") {
+            ids = event.ids;
+            setResults(event.results);
+            return;
+          }
+          const index = ids.indexOf(event.id);
+          // A failed summary or win reason just stays empty
+          if (index < 0 || event.type === "error") return;
+          const setter =
+            event.type === "what_they_did" ? setWhatTheyDid : setHowTheyWon;
+          setter((prev) => {
+            const next = [...prev];
+            next[index] = event.text;
+            return next;
+          });
+        }
+      );
     } catch (err) {
+      if (search !== searchCount.current) return;
       setError(err instanceof Error ? err.message : "An error occurred");
     }
   };
@@ -3,8 +3,9 @@
 /* eslint-disable @typescript-eslint/no-unused-vars */
 /* eslint-disable @next/next/no-html-link-for-pages */
 
-import { useState, FormEvent } from "react";
-import { Project, SimilarityResult } from "@/lib/types";
+import { useRef, useState, FormEvent } from "react";
+import { InsightsEvent, Project, SimilarityResult } from "@/lib/types";
+import { streamInsights } from "@/lib/insights";
 import Link from "next/link";
 import Markdown from "react-markdown";
 import { Loader2 } from "lucide-react";
@@ -84,101 +85,60 @@ export default function Main() {
   const [completedSteps, setCompletedSteps] = useState<number[]>([]);
   const [currentStep, setCurrentStep] = useState<number>(-1);
 
+  // Bumped by every search, so events still streaming in for an earlier
+  // search are dropped
+  const searchCount = useRef<number>(0);
+
   const handleSubmit = async (e: FormEvent<HTMLFormElement>) => {
     e.preventDefault();
     setError("");
     setSubmitted(true);
+    setResults([]);
+    setWhatTheyDid([]);
+    setHowTheyWon([]);
     setIsLoadingResults(true);
-
-    let data: SimilarityResult[] | null = null;
-    try {
-      const response = await fetch(`${baseUrl}/similar`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "ngrok-skip-browser-warning": true
-        } as any,
-        body: JSON.stringify({
-          document_or_link: input,
-          k: 3,
-          filter: { award: "big" },
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch similar projects");
-      }
-
-      data = (await response.json()) as SimilarityResult[];
-      setResults(data);
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred");
-    } finally {
-      setIsLoadingResults(false);
-    }
-
-    if (data === null) {
-      return;
-    }
-
     setIsLoadingWhatTheyDid(true);
-    try {
-      const response = await fetch(`${baseUrl}/what-they-did`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "ngrok-skip-browser-warning": true
-        } as any,
-        body: JSON.stringify({
-          documents: data.map(
-            ([, project]) => project.parsed_content.description_markdown
-          ),
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch what they did");
-      }
-
-      const d: string[] = await response.json();
-      setWhatTheyDid(d);
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred");
-    } finally {
-      setIsLoadingWhatTheyDid(false);
-    }
-
     setIsLoadingHowTheyWon(true);
-    try {
-      const response = await fetch(`${baseUrl}/how-they-won`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "ngrok-skip-browser-warning": true
-        } as any,
-        body: JSON.stringify({
-          documents: data.map(
-            ([, project]) => project.parsed_content.description_markdown
-          ),
-          prizes: data.map(([, project]) =>
-            project.parsed_content.submissions
-              .map((submission) => submission.awards.join(", "))
-              .join(", ")
-          ),
-          names: data.map(([_a, project]) => project.title),
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch how they won");
-      }
+    const search = ++searchCount.current;
+    const isCurrent = () => search === searchCount.current;
 
-      const d = await response.json();
-      setHowTheyWon(d);
+    // One request: the similar projects, then what they did and how they won
+    // for each of them, streamed as they are generated
+    try {
+      let ids: string[] = [];
+      await streamInsights(
+        `${baseUrl}/project-insights`,
+        { document_or_link: input, k: 3, filter: { award: "big" } },
+        { "ngrok-skip-browser-warning": "true" },
+        isCurrent,
+        (event: InsightsEvent) => {
+          if (event.type === "similar") {
+            ids = event.ids;
+            setResults(event.results);
+            setIsLoadingResults(false);
+            return;
+          }
+          const index = ids.indexOf(event.id);
+          // A failed summary or win reason just stays empty
+          if (index < 0 || event.type === "error") return;
+          const setter =
+            event.type === "what_they_did" ? setWhatTheyDid : setHowTheyWon;
+          setter((prev) => {
+            const next = [...prev];
+            next[index] = event.text;
+            return next;
+          });
+        }
+      );
     } catch (err) {
+      if (!isCurrent()) return;
       setError(err instanceof Error ? err.message : "An error occurred");
     } finally {
-      setIsLoadingHowTheyWon(false);
+      if (isCurrent()) {
+        setIsLoadingResults(false);
+        setIsLoadingWhatTheyDid(false);
+        setIsLoadingHowTheyWon(false);
+      }
     }
   };
 
@@ -422,7 +382,7 @@ export default function Main() {
                     />
                   ))}
                 </div>
-                {howTheyWon.length > 0 && (
+                {howTheyWon.length > 0 && !isLoadingHowTheyWon && (
                   <>
                     <button
                       onClick={handleSuggestions}
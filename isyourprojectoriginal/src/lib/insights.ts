@@ -0,0 +1,84 @@
+import { InsightsEvent, SimilarityResult } from "@/lib/types";
+
+export interface InsightsRequest {
+  document_or_link: string;
+  k: number;
+  filter?: Record<string, string>;
+}
+
+// The "similar" event as sent: without results when the etag we sent back
+// still matches
+type SimilarWireEvent = {
+  type: "similar";
+  ids: string[];
+  results?: SimilarityResult[];
+  etag?: string;
+  not_modified?: boolean;
+};
+type WireEvent = Exclude<InsightsEvent, { type: "similar" }> | SimilarWireEvent;
+
+// Similar projects already received, by request, with the etag that lets the
+// server skip sending them again when the same search is repeated
+const similarCache = new Map<
+  string,
+  { etag: string; results: SimilarityResult[] }
+>();
+
+// Runs a /project-insights request. The server streams one JSON event per
+// line, the similar projects first, then each summary / win reason as soon
+// as it is generated. Calls onEvent for each one until the stream ends or
+// isCurrent() turns false (a newer search started), which cancels the read.
+export async function streamInsights(
+  url: string,
+  request: InsightsRequest,
+  headers: Record<string, string>,
+  isCurrent: () => boolean,
+  onEvent: (event: InsightsEvent) => void
+) {
+  const key = JSON.stringify(request);
+  const cached = similarCache.get(key);
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { ...headers, "Content-Type": "application/json" },
+    body: JSON.stringify({ ...request, similar_etag: cached?.etag }),
+  });
+  if (!response.ok || response.body === null) {
+    throw new Error("Failed to fetch similar projects");
+  }
+
+  const handle = (event: WireEvent) => {
+    if (event.type === "similar") {
+      let results = event.results;
+      if (event.not_modified && cached) {
+        results = cached.results;
+      } else if (event.etag && results) {
+        similarCache.set(key, { etag: event.etag, results });
+      }
+      onEvent({ type: "similar", ids: event.ids, results: results ?? [] });
+      return;
+    }
+    onEvent(event);
+  };
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  const handleLines = (lines: string[]) =>
+    lines
+      .filter((line) => line.trim() && isCurrent())
+      .forEach((line) => handle(JSON.parse(line)));
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    if (!isCurrent()) {
+      reader.cancel();
+      return;
+    }
+    buffered += decoder.decode(value, { stream: true });
+    const lines = buffered.split("\n");
+    buffered = lines.pop() ?? "";
+    handleLines(lines);
+  }
+  handleLines([buffered]);
+}
@@ -34,3 +34,9 @@ export interface Project {
 
 // Array tuple of [similarity score, project]
 export type SimilarityResult = [number, Project];
+
+// Events streamed line by line from /project-insights
+export type InsightsEvent =
+  | { type: "similar"; ids: string[]; results: SimilarityResult[] }
+  | { type: "what_they_did" | "how_they_won"; id: string; text: string }
+  | { type: "error"; id: string; kind: "what_they_did" | "how_they_won" };
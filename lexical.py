@@ -0,0 +1,127 @@
+"""
+BM25 inverted index over the project corpus, stored next to the mmap snapshot.
+
+Dense retrieval needs a remote embedding call per query and can miss exact
+matches on project names and technologies. This index answers queries
+locally, either alone or fused with the vector results.
+
+Each project is indexed as its title and `built_with` (counted twice, since
+an exact hit there is a strong signal) plus its description. Rows follow the
+snapshot's sorted id order, so row numbers are shared with MmapIndex.
+
+Files, written by mmap_store.write_snapshot:
+    lexical_terms.npy     U32 (v,) sorted vocabulary
+    lexical_offsets.npy   int64 (v + 1,) start of each term's postings
+    lexical_rows.npy      int32 (p,) row of each posting
+    lexical_weights.npy   float32 (p,) BM25 weight of each posting
+"""
+import os
+import re
+
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+MAX_TERM_LENGTH = 32
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or so "
+    "that the their this to was we were which will with our you your i my".split()
+)
+
+_token = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [
+        t
+        for t in _token.findall(text.lower())
+        if t not in STOPWORDS and len(t) <= MAX_TERM_LENGTH
+    ]
+
+
+def project_tokens(project):
+    content = project.get("parsed_content", {})
+    boosted = " ".join([project.get("title") or ""] + content.get("built_with", []))
+    return tokenize(boosted) * 2 + tokenize(content.get("description_markdown", ""))
+
+
+def write_lexical(out_dir, projects):
+    """Writes the index for `projects`, a list of records in row order."""
+    doc_terms, doc_counts, lengths = [], [], []
+    for project in projects:
+        tokens = np.array(project_tokens(project), dtype="U32")
+        terms, counts = np.unique(tokens, return_counts=True)
+        doc_terms.append(terms)
+        doc_counts.append(counts)
+        lengths.append(counts.sum())
+
+    all_terms = np.concatenate(doc_terms) if doc_terms else np.array([], dtype="U32")
+    vocab, term_ids = np.unique(all_terms, return_inverse=True)
+    rows = np.repeat(
+        np.arange(len(projects), dtype=np.int32), [len(t) for t in doc_terms]
+    )
+    tf = np.concatenate(doc_counts or [[]]).astype(np.float32)
+
+    # Group postings by term; rows stay ascending within each term
+    order = np.argsort(term_ids, kind="stable")
+    term_ids, rows, tf = term_ids[order], rows[order], tf[order]
+    df = np.bincount(term_ids, minlength=len(vocab))
+    offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+    lengths = np.array(lengths, dtype=np.float32)
+    avg_length = max(lengths.mean(), 1.0) if len(lengths) else 1.0
+    idf = np.log1p((len(projects) - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = K1 * (1 - B + B * lengths[rows] / avg_length)
+    weights = idf[term_ids] * tf * (K1 + 1) / (tf + norm)
+
+    np.save(os.path.join(out_dir, "lexical_terms.npy"), vocab.astype("U32"))
+    np.save(os.path.join(out_dir, "lexical_offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "lexical_rows.npy"), rows)
+    np.save(os.path.join(out_dir, "lexical_weights.npy"), weights.astype(np.float32))
+
+
+def exists(snapshot_dir):
+    return os.path.exists(os.path.join(snapshot_dir, "lexical_terms.npy"))
+
+
+class LexicalIndex:
+    def __init__(self, snapshot_dir):
+        def load(name):
+            return np.load(os.path.join(snapshot_dir, name), mmap_mode="r")
+
+        self.terms = load("lexical_terms.npy")
+        self.offsets = load("lexical_offsets.npy")
+        self.rows = load("lexical_rows.npy")
+        self.weights = load("lexical_weights.npy")
+        self.num_rows = len(load("ids.npy"))
+
+    def _term_ids(self, text):
+        terms = np.unique(tokenize(text))
+        if not len(terms) or not len(self.terms):
+            return np.array([], dtype=np.int64)
+        found = np.searchsorted(self.terms, terms)
+        found = np.minimum(found, len(self.terms) - 1)
+        return found[self.terms[found] == terms]
+
+    def scores(self, text):
+        """BM25 score of every row for the query text."""
+        term_ids = self._term_ids(text)
+        if not len(term_ids):
+            return np.zeros(self.num_rows, dtype=np.float32)
+        starts, ends = self.offsets[term_ids], self.offsets[term_ids + 1]
+        rows = np.concatenate([self.rows[s:e] for s, e in zip(starts, ends)])
+        weights = np.concatenate([self.weights[s:e] for s, e in zip(starts, ends)])
+        return np.bincount(rows, weights=weights, minlength=self.num_rows)
+
+    def search(self, text, k, mask=None):
+        """Returns [(row, score)] for the k best matching rows, best first."""
+        scores = self.scores(text)
+        if mask is not None:
+            scores = np.where(mask, scores, 0)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top]
@@ -1,25 +1,226 @@
-from fastapi import FastAPI, Body
-import httpx
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query
 from typing import Optional, List
 from pydantic import BaseModel
-from openai import OpenAI
 import similar_to_others
-from scrape.devpost_page_scraper import DevpostScraper
+import did_it_win_big
+import prompt_budget
+import http_cache
 from urllib.parse import urlparse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import json
+from functools import lru_cache
+import hashlib
+import base64
+from ttl_cache import TTLCache
+import metrics
+from metrics import span
+import upstream
+from admission import Gate
+import orjson
+from contextlib import asynccontextmanager
+import threading
+import time
+import os
+
+
+class ORJSONResponse(Response):
+    """Serializes with orjson; endpoints return it directly so FastAPI skips
+    its jsonable_encoder pass. Pre-encoded bytes are sent as is."""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content)
+
+
+class GatedStreamingResponse(StreamingResponse):
+    """Releases an admission slot once the stream ends, however it ends."""
+
+    def __init__(self, content, gate, **kwargs):
+        super().__init__(content, **kwargs)
+        self.gate = gate
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.gate.release()
+
+
+# Heavy resources (project data, vector db) are loaded by warm_up() in a
+# background thread so the server accepts connections immediately; /ready
+# reports when they are available.
+ready = threading.Event()
+warmup_status = {"error": None, "seconds": None}
+
+# How often to check snapshots/CURRENT for a newly published index
+SNAPSHOT_POLL_SECONDS = 5
+
+# Admission limits per endpoint group. /similar is cheap and gets a wide gate
+# with a short queue deadline; the generation endpoints are throttled harder
+# so a spike in them cannot starve it.
+similar_gate = Gate("similar", concurrency=32, queue_size=256, max_wait=2)
+arena_gate = Gate("arena", concurrency=4, queue_size=16, max_wait=30)
+insights_gate = Gate("insights", concurrency=8, queue_size=64, max_wait=10)
+win_score_gate = Gate("win_score", concurrency=8, queue_size=64, max_wait=5)
+batch_gate = Gate("similar_batch", concurrency=4, queue_size=16, max_wait=10)
+
+# LLM calls run on threads of their own, so slow generations never hold the
+# threads /similar runs on.
+llm_executor = ThreadPoolExecutor(
+    max_workers=upstream.openai.concurrency, thread_name_prefix="llm"
+)
+
+
+# Links in batch requests are scraped on threads of their own, as many as the
+# Devpost pool allows, so a bulk audit never holds the threads /similar runs on.
+scrape_executor = ThreadPoolExecutor(
+    max_workers=upstream.devpost.concurrency, thread_name_prefix="scrape"
+)
+
+
+async def run_scrape(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(scrape_executor, fn, *args)
+
+
+async def run_llm(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(llm_executor, fn, *args)
+
+
+async def run_llm_all(fn, calls):
+    """Runs fn(*args) for each args in calls concurrently; results in order."""
+    return list(await asyncio.gather(*(run_llm(fn, *args) for args in calls)))
+
+
+def warm_up():
+    start = time.perf_counter()
+    try:
+        similar_to_others.warm_up()
+    except Exception as e:
+        warmup_status["error"] = repr(e)
+        raise
+    warmup_status["seconds"] = time.perf_counter() - start
+    ready.set()
+
+
+def watch_snapshots(stop):
+    while not stop.wait(SNAPSHOT_POLL_SECONDS):
+        if not ready.is_set():
+            continue
+        try:
+            similar_to_others.reload()
+        except Exception as e:
+            print(f"failed to load published snapshot: {e!r}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    stop = threading.Event()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    threading.Thread(
+        target=watch_snapshots, args=(stop,), name="snapshot-watch", daemon=True
+    ).start()
+    yield
+    stop.set()
+    await upstream.aclose()
+
+
+def require_ready():
+    if not ready.is_set():
+        raise HTTPException(
+            status_code=503, detail="Warming up", headers={"Retry-After": "1"}
+        )
+
+
+@lru_cache(maxsize=None)
+def openai_client():
+    from openai import OpenAI
+
+    # One client per process so its keep-alive pool is reused across requests
+    return OpenAI(timeout=upstream.openai.timeout)
+
+
+@lru_cache(maxsize=None)
+def devpost_scraper():
+    from scrape.devpost_page_scraper import DevpostScraper
+
+    return DevpostScraper()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+
+@app.middleware("http")
+async def time_requests(request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.request_seconds.observe(
+        time.perf_counter() - start,
+        path=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    return response
+
 
-client = OpenAI()
-app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Clients revalidating POST /similar by hand need to read the ETag
+    expose_headers=["ETag"],
 )
+app.add_middleware(http_cache.CompressionMiddleware)
+
+
+@app.get("/ready")
+def readiness():
+    if ready.is_set():
+        return ORJSONResponse(
+            {"ready": True, "warmup_seconds": warmup_status["seconds"]}
+        )
+    return ORJSONResponse(
+        {"ready": False, "error": warmup_status["error"]}, status_code=503
+    )
+
 
-uid_to_project = json.load(open("output/project_id_to_data.json", "r"))
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/reload")
+async def reload_snapshot(x_admin_token: Optional[str] = Header(default=None)):
+    """Loads the snapshot published in snapshots/CURRENT and swaps it in."""
+    token = os.getenv("FLIGHTDECK_ADMIN_TOKEN")
+    if not token or x_admin_token != token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    version = await asyncio.to_thread(similar_to_others.reload)
+    return ORJSONResponse({"version": version})
+
+
+# Responses are assembled by joining the snapshot's encoded project records
+# instead of re-encoding every project.
+def scored_projects_json(snapshot, data):
+    return (
+        b"["
+        + b",".join(
+            b"["
+            + orjson.dumps(float(score))
+            + b","
+            + snapshot.project_json(uid)
+            + b"]"
+            for score, uid in data
+        )
+        + b"]"
+    )
 
 
 def is_valid_url(url_string):
@@ -32,48 +233,496 @@ def is_valid_url(url_string):
         return False
 
 
+# Server-side caps; larger values are clamped rather than rejected so older
+# clients keep working.
+MAX_K = 100
+MAX_PAGE_SIZE = 25
+
+# Fields a client can ask for instead of the full project record
+PROJECTIONS = {
+    "id": lambda score, uid, project: uid,
+    "score": lambda score, uid, project: score,
+    "title": lambda score, uid, project: project["title"],
+    "tagline": lambda score, uid, project: project["tagline"],
+    "url": lambda score, uid, project: project["project_url"],
+    "thumbnail_url": lambda score, uid, project: project["thumbnail_url"],
+    "award": lambda score, uid, project: project.get("award"),
+}
+
+
 class RequestParams(BaseModel):
     document_or_link: str
     k: int
     filter: Optional[dict] = None
+    page_size: Optional[int] = None
+    cursor: Optional[str] = None
+    fields: Optional[List[str]] = None
+    # 0 to 1; above 0, near-duplicate results give way to different ones
+    diversity: Optional[float] = None
+
+
+similar_cache = TTLCache(maxsize=1024, ttl=600)
+metrics.CacheStats("similar", similar_cache)
+
+
+def similar_key(snapshot, document_or_link, k, filter, diversity=None):
+    return (
+        hashlib.sha256(document_or_link.encode()).hexdigest(),
+        k,
+        json.dumps(filter, sort_keys=True),
+        diversity or None,
+        snapshot.version,
+    )
 
 
-@app.post("/similar")
-def get_similar(request_params: RequestParams = Body(default=None)):
-    document_or_link = request_params.document_or_link
-    k = request_params.k
-    filter = request_params.filter
+# Results and the /similar cache hold only (score, id); project records stay
+# in the snapshot's store and are decoded only for a field projection that
+# needs them (see project_fields).
+def scored_records(snapshot, similar):
+    """(score, id) for search results, in the order the search ranked them:
+    best first, or the MMR order when a diversity was given."""
+    with span("record_lookup"):
+        return [(score, res.metadata["id"]) for res, score in similar]
+
+
+def find_similar(snapshot, document_or_link, k, filter=None, diversity=None):
+    key = similar_key(snapshot, document_or_link, k, filter, diversity)
+    cached = similar_cache.get(key)
+    if cached is not None:
+        return cached, "cached"
 
     document = document_or_link
     if is_valid_url(document_or_link):
-        document = DevpostScraper().scrape_submission(document_or_link)[
-            "description_markdown"
-        ]
-    similar = similar_to_others.get_similar(document, k, filter)
+        with span("scrape"):
+            document = devpost_scraper().scrape_submission(document_or_link)[
+                "description_markdown"
+            ]
+    similar, mode = snapshot.search(document, k, filter, diversity)
+    data = scored_records(snapshot, similar)
+
+    # A lexical answer given while the embedder is down should not outlive
+    # the outage
+    if mode != "fallback":
+        similar_cache.set(key, data)
+    return data, mode
+
+
+def query_digest(version, document_or_link, k, filter, diversity=None):
+    # Cursors are only valid against the index version they were issued for
+    key = json.dumps(
+        [version, document_or_link, k, filter, diversity], sort_keys=True
+    )
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def encode_cursor(offset, digest):
+    return base64.urlsafe_b64encode(f"{offset}:{digest}".encode()).decode()
+
+
+def decode_cursor(cursor, digest):
+    try:
+        offset, cursor_digest = base64.urlsafe_b64decode(cursor).decode().split(":")
+        offset = int(offset)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    if cursor_digest != digest or offset < 0:
+        raise HTTPException(status_code=400, detail="Cursor is for a different query")
+    return offset
+
+
+# Fields answered without decoding the project record
+RECORD_FREE_FIELDS = {"id", "score"}
+
+
+def project_fields(snapshot, fields, score, uid):
+    project = None
+    if not RECORD_FREE_FIELDS.issuperset(fields):
+        project = snapshot.projects[uid]
+    return {field: PROJECTIONS[field](score, uid, project) for field in fields}
+
+
+def check_fields(fields):
+    if fields is not None:
+        unknown = [f for f in fields if f not in PROJECTIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=422, detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+
+
+def results_json(snapshot, data, fields):
+    if fields is None:
+        return scored_projects_json(snapshot, data)
+    return orjson.dumps([project_fields(snapshot, fields, *item) for item in data])
+
+
+# Clients may keep /similar results but must revalidate them; a revalidation
+# for an unchanged index and query is answered 304 without searching
+SIMILAR_CACHE_CONTROL = "no-cache"
+
+
+@app.post("/similar", dependencies=[Depends(require_ready)])
+async def get_similar(
+    request_params: RequestParams = Body(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    return await similar_or_not_modified(request_params, if_none_match)
+
+
+@app.get("/similar", dependencies=[Depends(require_ready)])
+async def get_similar_by_query(
+    document_or_link: str,
+    k: int,
+    filter: Optional[str] = None,
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = Query(default=None),
+    diversity: Optional[float] = None,
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """/similar as a GET, so browsers cache and revalidate results by
+    themselves. filter is JSON; fields may be repeated."""
+    try:
+        filter = json.loads(filter) if filter else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="filter must be JSON")
+    request_params = RequestParams(
+        document_or_link=document_or_link,
+        k=k,
+        filter=filter,
+        page_size=page_size,
+        cursor=cursor,
+        fields=fields,
+        diversity=diversity,
+    )
+    return await similar_or_not_modified(request_params, if_none_match)
+
+
+async def similar_or_not_modified(request_params, if_none_match):
+    # Results are fixed by the index version and the query, so the ETag is
+    # known before searching
+    snapshot = similar_to_others.current()
+    etag = http_cache.etag(
+        snapshot.version, json.dumps(request_params.model_dump(), sort_keys=True)
+    )
+    matched = http_cache.matching_etag(if_none_match, etag)
+    if matched:
+        return Response(
+            status_code=304,
+            headers={"ETag": matched, "Cache-Control": SIMILAR_CACHE_CONTROL},
+        )
+    async with similar_gate.admit():
+        return await asyncio.to_thread(
+            similar_response, snapshot, request_params, etag
+        )
+
+
+def similar_response(snapshot, request_params, etag=None):
+    k = max(1, min(request_params.k, MAX_K))
+    fields = request_params.fields
+    check_fields(fields)
+    diversity = request_params.diversity
+    if diversity is not None and not 0 <= diversity <= 1:
+        raise HTTPException(
+            status_code=422, detail="diversity must be between 0 and 1"
+        )
+
+    data, mode = find_similar(
+        snapshot,
+        request_params.document_or_link,
+        k,
+        request_params.filter,
+        diversity,
+    )
+
+    paginate = (
+        request_params.page_size is not None or request_params.cursor is not None
+    )
+    next_cursor = None
+    if paginate:
+        digest = query_digest(
+            snapshot.version,
+            request_params.document_or_link,
+            k,
+            request_params.filter,
+            diversity,
+        )
+        offset = 0
+        if request_params.cursor is not None:
+            offset = decode_cursor(request_params.cursor, digest)
+        page_size = request_params.page_size or MAX_PAGE_SIZE
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        if offset + page_size < len(data):
+            next_cursor = encode_cursor(offset + page_size, digest)
+        data = data[offset : offset + page_size]
+
+    results = results_json(snapshot, data, fields)
+
+    # A lexical answer given while the embedder is down is not what the ETag
+    # stands for
+    headers = {"Cache-Control": "no-store"}
+    if etag is not None and mode != "fallback":
+        headers = {"ETag": etag, "Cache-Control": SIMILAR_CACHE_CONTROL}
+
+    if not paginate:
+        return ORJSONResponse(results, headers=headers)
+    return ORJSONResponse(
+        b'{"results":'
+        + results
+        + b',"next_cursor":'
+        + orjson.dumps(next_cursor)
+        + b"}",
+        headers=headers,
+    )
+
+
+# Inputs per /similar/batch request, counting the projects of a gallery
+MAX_BATCH_INPUTS = 1000
+# Inputs embedded and searched together per step of a /similar/batch stream
+BATCH_STEP = 64
+
+
+class SimilarBatchParams(BaseModel):
+    documents: List[str] = []
+    gallery_url: Optional[str] = None
+    k: int
+    filter: Optional[dict] = None
+    fields: Optional[List[str]] = None
+
+
+def gallery_links(gallery_url):
+    """Project links in a hackathon's gallery; takes the hackathon or gallery URL."""
+    from scrape.devpost_find_projects import DevPostScraper
+
+    if not urlparse(gallery_url).path.rstrip("/").endswith("project-gallery"):
+        gallery_url = gallery_url.rstrip("/") + "/project-gallery"
+    with span("gallery"):
+        projects = DevPostScraper(base_url=gallery_url).fetch_projects()
+    return [project["project_url"] for project in projects]
+
+
+def batch_document(snapshot, document_or_link):
+    """The text to search with; links to indexed projects are not scraped."""
+    if not is_valid_url(document_or_link):
+        return document_or_link
+    import corpus
+
+    project = snapshot.projects.get(corpus.project_id(document_or_link))
+    if project is not None:
+        return project["parsed_content"]["description_markdown"]
+    return scrape_if_link(document_or_link)
 
-    data = []
-    for res, score in similar:
-        project = uid_to_project[res.metadata["id"]]
-        data.append((score, project))
 
-    data.sort(key=lambda x: x[0], reverse=True)
+@app.post("/similar/batch", dependencies=[Depends(require_ready)])
+async def similar_batch(params: SimilarBatchParams):
+    """/similar for many documents or links, plus every project in a
+    hackathon gallery if gallery_url is given.
 
-    return data
+    Streams one NDJSON line per input, in input order:
+    {"index": i, "results": [...]} or {"index": i, "error": "..."}, with
+    "link" set for links. All links are scraped concurrently up front, while
+    the inputs are embedded and searched BATCH_STEP at a time (see
+    Snapshot.search_batch). Results share the /similar cache.
+    """
+    k = max(1, min(params.k, MAX_K))
+    check_fields(params.fields)
+    snapshot = similar_to_others.current()
+    # The slot is held until the stream ends; GatedStreamingResponse frees it
+    await batch_gate.acquire()
+    try:
+        inputs = list(params.documents)
+        if params.gallery_url:
+            if not is_valid_url(params.gallery_url):
+                raise HTTPException(status_code=422, detail="Invalid gallery_url")
+            inputs += await run_scrape(gallery_links, params.gallery_url)
+        if not 1 <= len(inputs) <= MAX_BATCH_INPUTS:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Send between 1 and {MAX_BATCH_INPUTS} documents or links",
+            )
+    except BaseException:
+        batch_gate.release()
+        raise
+
+    keys = [similar_key(snapshot, item, k, params.filter) for item in inputs]
+    data = [similar_cache.get(key) for key in keys]
+    documents = [
+        None if found is not None else asyncio.ensure_future(
+            run_scrape(batch_document, snapshot, item)
+        )
+        for item, found in zip(inputs, data)
+    ]
+
+    def line(i, **body):
+        head = {"index": i}
+        if is_valid_url(inputs[i]):
+            head["link"] = inputs[i]
+        if "results" not in body:
+            return orjson.dumps(dict(head, **body)) + b"\n"
+        return orjson.dumps(head)[:-1] + b',"results":' + body["results"] + b"}\n"
+
+    async def lines():
+        try:
+            for start in range(0, len(inputs), BATCH_STEP):
+                step = range(start, min(start + BATCH_STEP, len(inputs)))
+                errors, texts = {}, {}
+                for i in step:
+                    if data[i] is not None:
+                        continue
+                    try:
+                        texts[i] = await documents[i]
+                    except Exception as e:
+                        print(f"failed to read batch input {i}: {e!r}")
+                        errors[i] = "Could not read this document or link"
+                    else:
+                        if not texts[i].strip():
+                            del texts[i]
+                            errors[i] = "There is nothing to search for"
+                if texts:
+                    pending = list(texts)
+                    try:
+                        found = await asyncio.to_thread(
+                            snapshot.search_batch,
+                            [texts[i] for i in pending],
+                            k,
+                            params.filter,
+                        )
+                    except Exception as e:
+                        print(f"batch search failed: {e!r}")
+                        errors.update((i, "Search is unavailable") for i in pending)
+                    else:
+                        for i, (similar, mode) in zip(pending, found):
+                            data[i] = scored_records(snapshot, similar)
+                            if mode != "fallback":
+                                similar_cache.set(keys[i], data[i])
+                for i in step:
+                    if i in errors:
+                        yield line(i, error=errors[i])
+                    else:
+                        yield line(
+                            i, results=results_json(snapshot, data[i], params.fields)
+                        )
+        finally:
+            # The client may have gone; drop scrapes that have not started
+            for document in documents:
+                if document is not None:
+                    document.cancel()
+
+    return GatedStreamingResponse(
+        lines(), batch_gate, media_type="application/x-ndjson"
+    )
+
+
+# Documents per /win-score request; they are embedded together
+MAX_WIN_SCORE_DOCUMENTS = 64
+
+
+class WinScoreParams(BaseModel):
+    documents: List[str]
+    k: int = 25
+
+
+def scrape_if_link(document_or_link):
+    if not is_valid_url(document_or_link):
+        return document_or_link
+    with span("scrape"):
+        parsed = devpost_scraper().scrape_submission(document_or_link)
+    if parsed is None:
+        # The scraper logs the failure and returns None
+        raise ValueError(f"Could not scrape {document_or_link}")
+    return parsed["description_markdown"]
+
+
+async def read_document(document_or_link):
+    """The text of a document or link, or None if the link cannot be read."""
+    try:
+        return await run_scrape(scrape_if_link, document_or_link)
+    except Exception as e:
+        print(f"failed to read {document_or_link[:100]!r}: {e!r}")
+        return None
+
+
+@app.post("/win-score", dependencies=[Depends(require_ready)])
+async def win_score(params: WinScoreParams):
+    """Scores writeups (or Devpost links) against the index's award classes.
+
+    No LLM is involved: the documents are embedded in one batch and scored
+    by the snapshot's local classifier and a vote of their nearest projects,
+    see did_it_win_big.py.
+    """
+    if not 1 <= len(params.documents) <= MAX_WIN_SCORE_DOCUMENTS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Send between 1 and {MAX_WIN_SCORE_DOCUMENTS} documents",
+        )
+    blank = [i for i, d in enumerate(params.documents) if not d.strip()]
+    if blank:
+        raise HTTPException(status_code=422, detail=f"Documents {blank} are empty")
+    async with win_score_gate.admit():
+        documents = await asyncio.gather(*map(read_document, params.documents))
+        return await asyncio.to_thread(win_score_response, documents, params.k)
+
+
+def win_score_response(documents, k):
+    snapshot = similar_to_others.current()
+    if snapshot.scorer is None:
+        raise HTTPException(
+            status_code=503, detail="This index has no vectors to score against"
+        )
+    # A link that could not be read, or whose page has no writeup, has
+    # nothing to score
+    present = [i for i, d in enumerate(documents) if d is not None and d.strip()]
+    scores = [
+        {
+            "error": "Could not read this link"
+            if d is None
+            else "This link has no writeup to score"
+        }
+        for d in documents
+    ]
+    if present:
+        try:
+            with span("embed"):
+                vectors = similar_to_others.embed_batch(
+                    [documents[i] for i in present], "search_document"
+                )
+        except Exception as e:
+            print(f"embedding failed for win score: {e!r}")
+            raise HTTPException(status_code=503, detail="Embedding is unavailable")
+        with span("win_score"):
+            found = snapshot.scorer.score(vectors, max(1, min(k, MAX_K)))
+        for i, score in zip(present, found):
+            scores[i] = score
+    prior = dict(zip(did_it_win_big.CLASSES, snapshot.scorer.prior.tolist()))
+    return ORJSONResponse({"results": scores, "prior": prior})
+
+
+# /arena's five references should cover different winning ideas, not five
+# takes on one; see Snapshot.diversify
+ARENA_DIVERSITY = 0.3
 
 
 class SuggestionParams(BaseModel):
     project_doc: str
 
 
-prompt = """Here's a bunch of projects that won hackathons that are similar to mine:
+# Fixed text first, then the references, then the user's writeup, so that
+# requests sharing references share a prompt prefix the LLM provider can cache
+prompt = """Help me make a writeup that uses ideas from the winning teams but keeps my idea the same. Only write the hackathon writeup. Put important ideas in bold. Keep the writeup easy and fun to read. Start with a title.
+
+Here's a bunch of projects that won hackathons that are similar to mine:
 {winning_projects}
 
 ---
 
 Here's my idea:
-{user_project}
+{user_project}"""
 
-Help me make a writeup that uses ideas from the winning teams but keeps my idea the same. Only write the hackathon writeup. Put important ideas in bold. Keep the writeup easy and fun to read. Start with a title."""
+# Token budget of the /arena prompt. The user's writeup gets up to
+# ARENA_USER_TOKENS of it and the references share the rest, each cut down to
+# its first sections that fit (see prompt_budget.py).
+ARENA_PROMPT_TOKENS = int(os.getenv("FLIGHTDECK_ARENA_PROMPT_TOKENS", "6000"))
+ARENA_USER_TOKENS = 2000
 
 
 class Suggestion(BaseModel):
@@ -86,72 +735,104 @@ class SuggestionReturn(BaseModel):
     sorted_suggestions: List[str]
 
 
-similarity_server = "http://localhost:8001"
+similarity_server = os.getenv("FLIGHTDECK_RANKER_URL", "http://localhost:8001")
 
 
-@app.post("/arena")
+@app.post("/arena", dependencies=[Depends(require_ready)])
 async def make_arena(
     params: SuggestionParams = Body(default=None),
 ) -> SuggestionReturn:
-    doc = params.project_doc
-    similar = similar_to_others.get_similar(doc=doc, k=5, filt={"award": "big"})
+    async with arena_gate.admit():
+        return await arena(params)
 
-    similar_projects = [uid_to_project[res.metadata["id"]] for res, _ in similar]
-    texts_that_are_similar = [s["parsed_content"]["description_markdown"] for s in similar_projects]
-    similar = "\n\n---\n\n".join(
-        texts_that_are_similar
+
+def generate_ideas(p):
+    with upstream.openai.slot(), span("llm_arena"):
+        response = openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "user", "content": [{"type": "text", "text": p}]},
+            ],
+            response_format={"type": "text"},
+            temperature=1,
+            max_tokens=4096,
+            top_p=1,
+            n=10,
+            frequency_penalty=0,
+            presence_penalty=0,
+        )
+    metrics.record_usage("arena", response)
+
+    return [r.message.content for r in response.choices]
+
+
+def arena_prompt(snapshot, doc, similar_ids):
+    # The references' budget and compression do not depend on the user's
+    # writeup, and they are in id order, so the same references always make
+    # the same prompt prefix
+    separator = "\n\n---\n\n"
+    overhead = prompt_budget.count_tokens(
+        prompt.format(winning_projects="", user_project="")
+    ) + prompt_budget.count_tokens(separator) * (len(similar_ids) - 1)
+    user_tokens = max(0, min(ARENA_USER_TOKENS, ARENA_PROMPT_TOKENS - overhead))
+    user_project = prompt_budget.truncate(doc, user_tokens)
+    budget = max(0, ARENA_PROMPT_TOKENS - user_tokens - overhead)
+    texts = [
+        snapshot.projects[uid]["parsed_content"]["description_markdown"]
+        for uid in sorted(similar_ids)
+    ]
+    references = prompt_budget.fit(texts, budget)
+    return prompt.format(
+        winning_projects=separator.join(references), user_project=user_project
     )
 
-    p = prompt.format(winning_projects=similar, user_project=doc)
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "user", "content": [{"type": "text", "text": p}]},
-        ],
-        response_format={"type": "text"},
-        temperature=1,
-        max_tokens=4096,
-        top_p=1,
-        n=10,
-        frequency_penalty=0,
-        presence_penalty=0,
+async def arena(params):
+    doc = params.project_doc
+    snapshot = similar_to_others.current()
+    similar = await asyncio.to_thread(
+        snapshot.get_similar,
+        doc=doc,
+        k=5,
+        filt={"award": "big"},
+        diversity=ARENA_DIVERSITY,
     )
 
-    choices = [r.message.content for r in response.choices]
+    with span("record_lookup"):
+        similar_ids = [res.metadata["id"] for res, _ in similar]
+        similar_projects = [snapshot.projects[uid] for uid in similar_ids]
+    texts_that_are_similar = [s["parsed_content"]["description_markdown"] for s in similar_projects]
+
+    with span("prompt"):
+        p = arena_prompt(snapshot, doc, similar_ids)
 
-    async with httpx.AsyncClient() as c:
-        # Set default headers if none provided
-        headers = {"Content-Type": "application/json"}
+    choices = await run_llm(generate_ideas, p)
 
-        # Make the POST request
-        response = await c.post(
+    with span("ranker"):
+        response = await upstream.ranker.async_post(
             similarity_server + "/similarity",
-            json={"good_projects": texts_that_are_similar, "other_projects": choices},
-            headers=headers,
-            timeout=30.0,
+            json={
+                "good_projects": texts_that_are_similar,
+                "other_projects": choices,
+            },
         )
-
         sim = response.json()
 
     sorted_suggestions = [x for x, _ in sorted(list(zip(choices, sim)), key=lambda x: x[1], reverse=True)]
 
-    return SuggestionReturn(
-        similar_projects=similar_projects,
-        sorted_suggestions=sorted_suggestions,
+    # Same shape as SuggestionReturn, built from the pre-encoded records
+    return ORJSONResponse(
+        b'{"similar_projects":['
+        + b",".join(snapshot.project_json(uid) for uid in similar_ids)
+        + b'],"sorted_suggestions":'
+        + orjson.dumps(sorted_suggestions)
+        + b"}"
     )
 
 
-class WhatTheyDidParams(BaseModel):
-    documents: List[str]
-
-
-@app.post("/what-they-did")
-async def what_they_did(docs: WhatTheyDidParams = Body(default=None)):
-    d = docs.documents
-    summary = []
-    for doc in d:
-        response = client.chat.completions.create(
+def summarize_project(doc):
+    with upstream.openai.slot(), span("llm_summary"):
+        response = openai_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -171,26 +852,14 @@ async def what_they_did(docs: WhatTheyDidParams = Body(default=None)):
             frequency_penalty=0,
             presence_penalty=0,
         )
+    metrics.record_usage("summary", response)
 
-        what_they_did = response.choices[0].message.content
-        summary.append(what_they_did)
+    return response.choices[0].message.content
 
-    return summary
 
-class WhatTheyDidParams(BaseModel):
-    documents: List[str]
-    prizes: List[str]
-    names: List[str]
-
-
-@app.post("/how-they-won")
-async def what_won(docs: WhatTheyDidParams = Body(default=None)):
-    d = docs.documents
-    p = docs.prizes
-    n = docs.names
-    summary = []
-    for doc, prize, name in zip(d, p, n):
-        response = client.chat.completions.create(
+def explain_win(doc, prize, name):
+    with upstream.openai.slot(), span("llm_win_reason"):
+        response = openai_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -210,8 +879,219 @@ async def what_won(docs: WhatTheyDidParams = Body(default=None)):
             frequency_penalty=0,
             presence_penalty=0,
         )
+    metrics.record_usage("win_reason", response)
+
+    return response.choices[0].message.content
+
+
+def project_prize(project):
+    return ", ".join(
+        ", ".join(sub["awards"]) for sub in project["parsed_content"]["submissions"]
+    )
+
+
+def resolve_projects(snapshot, uids):
+    for uid in uids:
+        if uid not in snapshot.projects:
+            raise HTTPException(status_code=404, detail=f"Unknown project id: {uid}")
+
+
+# Generated text for a corpus project is reused across requests, users and
+# index builds until it ages out. Project ids are stable across builds while
+# their content is not, so the key also covers what the text is made from.
+insight_cache = TTLCache(maxsize=8192, ttl=24 * 60 * 60)
+metrics.CacheStats("insights", insight_cache)
+
+
+def insight_key(kind, uid, project):
+    content = "\0".join(
+        [
+            project["title"],
+            project["parsed_content"]["description_markdown"],
+            project_prize(project),
+        ]
+    )
+    return (kind, uid, hashlib.sha256(content.encode()).hexdigest())
+
+
+def summarize_known_project(snapshot, uid):
+    project = snapshot.projects[uid]
+    key = insight_key("what_they_did", uid, project)
+    text = insight_cache.get(key)
+    if text is None:
+        text = summarize_project(project["parsed_content"]["description_markdown"])
+        insight_cache.set(key, text)
+    return text
+
+
+def explain_known_win(snapshot, uid):
+    project = snapshot.projects[uid]
+    key = insight_key("how_they_won", uid, project)
+    text = insight_cache.get(key)
+    if text is None:
+        text = explain_win(
+            project["parsed_content"]["description_markdown"],
+            project_prize(project),
+            project["title"],
+        )
+        insight_cache.set(key, text)
+    return text
+
+
+# Projects per /what-they-did or /how-they-won request, one LLM call each;
+# without a cap one request could take every thread of llm_executor
+MAX_INSIGHT_ITEMS = 20
+
+
+def check_insight_items(items):
+    if len(items) > MAX_INSIGHT_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Send at most {MAX_INSIGHT_ITEMS} projects per request",
+        )
+
+
+class WhatTheyDidParams(BaseModel):
+    documents: Optional[List[str]] = None
+    ids: Optional[List[str]] = None
+
+
+@app.post("/what-they-did", dependencies=[Depends(require_ready)])
+async def what_they_did(docs: WhatTheyDidParams = Body(default=None)):
+    if docs.ids is not None:
+        check_insight_items(docs.ids)
+        snapshot = similar_to_others.current()
+        resolve_projects(snapshot, docs.ids)
+        async with insights_gate.admit():
+            return ORJSONResponse(
+                await run_llm_all(
+                    summarize_known_project, [(snapshot, uid) for uid in docs.ids]
+                )
+            )
+    if docs.documents is None:
+        raise HTTPException(status_code=422, detail="Pass either documents or ids")
+    check_insight_items(docs.documents)
+    async with insights_gate.admit():
+        return ORJSONResponse(
+            await run_llm_all(summarize_project, [(doc,) for doc in docs.documents])
+        )
+
+
+class HowTheyWonParams(BaseModel):
+    documents: Optional[List[str]] = None
+    prizes: Optional[List[str]] = None
+    names: Optional[List[str]] = None
+    ids: Optional[List[str]] = None
+
+
+@app.post("/how-they-won", dependencies=[Depends(require_ready)])
+async def what_won(docs: HowTheyWonParams = Body(default=None)):
+    if docs.ids is not None:
+        check_insight_items(docs.ids)
+        snapshot = similar_to_others.current()
+        resolve_projects(snapshot, docs.ids)
+        async with insights_gate.admit():
+            return ORJSONResponse(
+                await run_llm_all(
+                    explain_known_win, [(snapshot, uid) for uid in docs.ids]
+                )
+            )
+    if docs.documents is None or docs.prizes is None or docs.names is None:
+        raise HTTPException(
+            status_code=422, detail="Pass either ids or documents, prizes and names"
+        )
+    check_insight_items(docs.documents)
+    async with insights_gate.admit():
+        return ORJSONResponse(
+            await run_llm_all(
+                explain_win, zip(docs.documents, docs.prizes, docs.names)
+            )
+        )
+
+
+# Every result starts two LLM calls, so /project-insights gets a much lower
+# cap than /similar
+MAX_INSIGHTS_K = 10
+
+
+class InsightsParams(BaseModel):
+    document_or_link: str
+    k: int = 3
+    filter: Optional[dict] = None
+    # The etag of a "similar" event the client already holds
+    similar_etag: Optional[str] = None
+
+
+@app.post("/project-insights", dependencies=[Depends(require_ready)])
+async def project_insights(params: InsightsParams = Body(default=None)):
+    """Runs /similar, /what-they-did and /how-they-won in one request.
+
+    Streams newline-delimited JSON events: one "similar" event with the
+    results and their ids, then a "what_they_did" and a "how_they_won" event
+    per project (referenced by id) in whatever order they finish. A call that
+    fails gives an "error" event for its project and kind instead.
+
+    The "similar" event carries an etag, as /similar does. A request whose
+    similar_etag still matches gets the ids with "not_modified" instead of
+    the project records, which the client already has.
+    """
+    snapshot = similar_to_others.current()
+    k = max(1, min(params.k, MAX_INSIGHTS_K))
+    etag = http_cache.etag(
+        snapshot.version,
+        json.dumps([params.document_or_link, k, params.filter], sort_keys=True),
+    )
+    # The slot is held until the stream ends; GatedStreamingResponse frees it
+    await insights_gate.acquire()
+    try:
+        data, mode = await asyncio.to_thread(
+            find_similar, snapshot, params.document_or_link, k, params.filter
+        )
+    except BaseException:
+        insights_gate.release()
+        raise
+    # A lexical answer given while the embedder is down is not what the etag
+    # stands for
+    if mode == "fallback":
+        etag = None
+
+    async def tagged(kind, uid, fn, *args):
+        try:
+            return {"type": kind, "id": uid, "text": await run_llm(fn, *args)}
+        except Exception as e:
+            print(f"{kind} failed for {uid}: {e!r}")
+            return {"type": "error", "id": uid, "kind": kind}
 
-        what_they_did = response.choices[0].message.content
-        summary.append(what_they_did)
+    async def events():
+        head = b'{"type":"similar","ids":' + orjson.dumps([uid for _, uid in data])
+        if etag is not None:
+            head += b',"etag":' + orjson.dumps(etag)
+        if etag is not None and http_cache.matching_etag(params.similar_etag, etag):
+            yield head + b',"not_modified":true}\n'
+        else:
+            yield head + b',"results":' + scored_projects_json(snapshot, data) + b"}\n"
 
-    return summary
+        tasks = []
+        for _, uid in data:
+            tasks.append(
+                asyncio.ensure_future(
+                    tagged("what_they_did", uid, summarize_known_project, snapshot, uid)
+                )
+            )
+            tasks.append(
+                asyncio.ensure_future(
+                    tagged("how_they_won", uid, explain_known_win, snapshot, uid)
+                )
+            )
+
+        try:
+            for next_event in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_event) + b"\n"
+        finally:
+            # The client went away; calls not yet on a thread are dropped
+            for task in tasks:
+                task.cancel()
+
+    return GatedStreamingResponse(
+        events(), insights_gate, media_type="application/x-ndjson"
+    )
@@ -0,0 +1,177 @@
+"""
+Minimal Prometheus-style metrics for the API.
+
+Counters and histograms live in this process only; with several workers each
+one exposes its own numbers on /metrics and the scraper aggregates them.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("flightdeck.timing")
+
+# Seconds; covers everything from cache hits to multi-completion LLM calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60,
+)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self._values.items()
+            )
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, [("le", bound)])
+                yield f"{self.name}_bucket{labels} {bucket_count}"
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class CacheStats:
+    """Exports the hit/miss counts a TTLCache already keeps."""
+
+    def __init__(self, name, cache):
+        self.name, self.cache = name, cache
+        _registry.append(self)
+
+    def collect(self):
+        for result in ("hit", "miss"):
+            value = self.cache.hits if result == "hit" else self.cache.misses
+            yield (
+                f'flightdeck_cache_requests_total{{cache="{self.name}",'
+                f'result="{result}"}} {value}'
+            )
+
+
+request_seconds = Histogram(
+    "flightdeck_request_seconds", "End-to-end request latency", ["path", "status"]
+)
+stage_seconds = Histogram(
+    "flightdeck_stage_seconds", "Latency of each stage of a request", ["stage"]
+)
+llm_tokens = Counter(
+    "flightdeck_llm_tokens_total",
+    "Tokens used by upstream LLM calls",
+    ["call", "kind"],
+)
+queue_seconds = Histogram(
+    "flightdeck_queue_seconds",
+    "Time requests waited for admission",
+    ["endpoint"],
+)
+retrieval_fallback = Counter(
+    "flightdeck_retrieval_fallback_total",
+    "Queries answered from the lexical index because embedding failed",
+    ["reason"],
+)
+admission_rejected = Counter(
+    "flightdeck_admission_rejected_total",
+    "Requests turned away by admission control",
+    ["endpoint", "reason"],
+)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        logger.debug("stage=%s seconds=%.6f", stage, elapsed)
+
+
+def record_usage(call, response):
+    """Counts the tokens reported on an OpenAI-style completion response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    llm_tokens.inc(usage.prompt_tokens or 0, call=call, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens or 0, call=call, kind="completion")
+    # Prompt tokens the provider served from its prompt cache
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    if cached:
+        llm_tokens.inc(cached, call=call, kind="cached_prompt")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP flightdeck_cache_requests_total Cache lookups by result",
+        "# TYPE flightdeck_cache_requests_total counter",
+    ]
+    for metric in _registry:
+        if isinstance(metric, CacheStats):
+            lines.extend(metric.collect())
+    for metric in _registry:
+        if not isinstance(metric, CacheStats):
+            lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
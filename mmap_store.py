@@ -0,0 +1,377 @@
+"""
+Read-only, memory-mapped copies of the vector index and the project data.
+
+Every file is opened with mmap, so any number of API workers on one machine
+share a single copy through the page cache instead of each parsing the
+project JSON and loading its own vector db. Rows are sorted by project id so
+lookups are a binary search over the mapped id column and need no per-worker
+dict.
+
+Layout of a snapshot directory:
+    vectors.npy          float32 (m, dim) embeddings, m = n unless chunked
+    sq_norms.npy         float32 (m,) squared L2 norm of each vector
+    chunk_offsets.npy    int64 (n + 1,) first vector of each project, only
+                         written for chunked indexes (see chunking.py)
+    vectors_int8.npy     int8 (m, dim) scalar-quantized vectors
+    int8_scales.npy      float32 (m,) per-vector scale: v ~ scale * code
+    vectors_binary.npy   uint8 (m, dim / 8) packed sign bits
+    ids.npy              S36 (n,) sorted project ids
+    awards.npy           uint8 (n,) award code, see AWARDS
+    projects.bin         orjson-encoded project records, back to back
+    project_offsets.npy  int64 (n + 1,) byte offsets into projects.bin
+    win_head.npz         award classifier over the vectors, see did_it_win_big.py
+    lexical_*.npy        BM25 inverted index, see lexical.py
+
+Export the current Chroma db with: python mmap_store.py [out_dir]
+"""
+import mmap
+import os
+import sys
+
+import numpy as np
+import orjson
+
+import did_it_win_big
+import lexical
+
+AWARDS = ["none", "small", "big"]
+
+QUANTIZATIONS = ["int8", "binary"]
+# With a quantized scan, this many candidates per requested result are
+# re-ranked with the float vectors. Sign bits order neighbours much more
+# coarsely than int8 codes, so binary needs a deeper shortlist; see
+# bench/quantization.py
+RERANK_CANDIDATES = {"int8": 4, "binary": 30}
+# Rows converted to float per step of an int8 scan; small enough that the
+# scratch block stays in cache
+SCAN_BLOCK = 1024
+# Queries scored per pass of search_batch; bounds the (queries, rows)
+# distance matrix
+QUERY_BLOCK = 32
+
+
+def quantize_int8(vectors):
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors):
+    return np.packbits(vectors > 0, axis=1)
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(1)
+
+    def _popcount(x):
+        return _POPCOUNT[x]
+
+
+def write_snapshot(out_dir, ids, vectors, awards, projects):
+    """Writes a snapshot. `projects` maps each id to its project record.
+
+    ids and awards are given per vector. An id may repeat when a project is
+    indexed as several chunks; its vectors are then stored contiguously.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    vector_ids = np.array(ids, dtype="S36")
+    order = np.argsort(vector_ids, kind="stable")
+    vector_ids = vector_ids[order]
+    vectors = np.asarray(vectors, dtype=np.float32)[order]
+    unique_ids, starts = np.unique(vector_ids, return_index=True)
+    chunk_offsets = None
+    if len(unique_ids) < len(vector_ids):
+        chunk_offsets = np.append(starts, len(vector_ids)).astype(np.int64)
+        np.save(os.path.join(out_dir, "chunk_offsets.npy"), chunk_offsets)
+    ids = [uid.decode() for uid in unique_ids]
+    awards = [awards[order[start]] for start in starts]
+
+    np.save(os.path.join(out_dir, "vectors.npy"), vectors)
+    codes, scales = quantize_int8(vectors)
+    np.save(os.path.join(out_dir, "vectors_int8.npy"), codes)
+    np.save(os.path.join(out_dir, "int8_scales.npy"), scales)
+    np.save(os.path.join(out_dir, "vectors_binary.npy"), quantize_binary(vectors))
+    np.save(
+        os.path.join(out_dir, "sq_norms.npy"),
+        np.einsum("ij,ij->i", vectors, vectors).astype(np.float32),
+    )
+    np.save(os.path.join(out_dir, "ids.npy"), np.array(ids, dtype="S36"))
+    award_codes = np.array([AWARDS.index(a) for a in awards], dtype=np.uint8)
+    np.save(os.path.join(out_dir, "awards.npy"), award_codes)
+    if len(ids):
+        did_it_win_big.write_head(out_dir, vectors, chunk_offsets, award_codes)
+
+    offsets = [0]
+    with open(os.path.join(out_dir, "projects.bin"), "wb") as f:
+        for uid in ids:
+            offsets.append(offsets[-1] + f.write(orjson.dumps(projects[uid])))
+    offsets = np.array(offsets, dtype=np.int64)
+    np.save(os.path.join(out_dir, "project_offsets.npy"), offsets)
+
+    lexical.write_lexical(out_dir, [projects[uid] for uid in ids])
+
+
+def export_from_chroma(db, projects, out_dir):
+    """Copies the embeddings out of a langchain Chroma store into a snapshot."""
+    data = db.get(include=["embeddings", "metadatas"])
+    ids = [m["id"] for m in data["metadatas"]]
+    awards = [m["award"] for m in data["metadatas"]]
+    write_snapshot(out_dir, ids, data["embeddings"], awards, projects)
+
+
+def _row_of(ids, uid):
+    key = uid.encode() if isinstance(uid, str) else uid
+    row = int(np.searchsorted(ids, key))
+    if row < len(ids) and ids[row] == key:
+        return row
+    return None
+
+
+class ProjectStore:
+    """Dict-like, read-only view of the project records in a snapshot."""
+
+    def __init__(self, snapshot_dir):
+        self.ids = np.load(os.path.join(snapshot_dir, "ids.npy"), mmap_mode="r")
+        self.offsets = np.load(
+            os.path.join(snapshot_dir, "project_offsets.npy"), mmap_mode="r"
+        )
+        with open(os.path.join(snapshot_dir, "projects.bin"), "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def blob(self, uid):
+        """The encoded record, ready to be spliced into a JSON response."""
+        row = _row_of(self.ids, uid)
+        if row is None:
+            raise KeyError(uid)
+        return self._buf[self.offsets[row] : self.offsets[row + 1]]
+
+    def __getitem__(self, uid):
+        return orjson.loads(self.blob(uid))
+
+    def get(self, uid, default=None):
+        try:
+            return self[uid]
+        except KeyError:
+            return default
+
+    def __contains__(self, uid):
+        return _row_of(self.ids, uid) is not None
+
+    def __iter__(self):
+        return (uid.decode() for uid in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def values(self):
+        return (self[uid] for uid in self)
+
+
+class MmapIndex:
+    """Nearest-neighbour search over the mapped vectors.
+
+    Scores are squared L2 distances, matching what Chroma returns from
+    similarity_search_with_score, so either backend can serve the API.
+
+    By default every float vector is scanned. With quantization="int8" or
+    "binary" the scan runs over the 4x or 32x smaller quantized copy and only
+    the best `rerank` * k projects are scored exactly, so the float
+    vectors can stay on disk while the scanned array fits in cache.
+    """
+
+    def __init__(self, snapshot_dir, quantization=None, rerank=None):
+        def load(name):
+            return np.load(os.path.join(snapshot_dir, name), mmap_mode="r")
+
+        self.vectors = np.load(
+            os.path.join(snapshot_dir, "vectors.npy"), mmap_mode="r"
+        )
+        self.sq_norms = np.load(
+            os.path.join(snapshot_dir, "sq_norms.npy"), mmap_mode="r"
+        )
+        self.ids = np.load(os.path.join(snapshot_dir, "ids.npy"), mmap_mode="r")
+        self.awards = np.load(os.path.join(snapshot_dir, "awards.npy"), mmap_mode="r")
+        self.chunk_offsets = None
+        if os.path.exists(os.path.join(snapshot_dir, "chunk_offsets.npy")):
+            self.chunk_offsets = np.load(
+                os.path.join(snapshot_dir, "chunk_offsets.npy"), mmap_mode="r"
+            )
+
+        self.quantization = quantization
+        self.rerank = rerank or RERANK_CANDIDATES.get(quantization)
+        if quantization == "int8":
+            self.codes = load("vectors_int8.npy")
+            self.scales = load("int8_scales.npy")
+        elif quantization == "binary":
+            self.bits = load("vectors_binary.npy")
+        elif quantization is not None:
+            raise ValueError(f"Unknown quantization: {quantization}")
+
+    def warm(self):
+        """Reads the arrays a search scans, so they are in the page cache."""
+        if self.quantization == "int8":
+            self.codes.sum()
+        elif self.quantization == "binary":
+            self.bits.sum()
+        else:
+            self.vectors.sum()
+
+    def mask(self, filt):
+        """Boolean row mask for a Chroma-style metadata filter, or None."""
+        if not filt:
+            return None
+        if set(filt) != {"award"}:
+            raise ValueError(f"Unsupported filter: {filt}")
+        wanted = filt["award"]
+        if isinstance(wanted, dict):
+            if set(wanted) != {"$in"}:
+                raise ValueError(f"Unsupported filter: {filt}")
+            wanted = wanted["$in"]
+        else:
+            wanted = [wanted]
+        codes = [AWARDS.index(w) for w in wanted if w in AWARDS]
+        return np.isin(self.awards, codes)
+
+    def search(self, query, k, filt=None):
+        """Returns [(row, distance)] for the k closest rows, closest first."""
+        query = np.asarray(query, dtype=np.float32)
+        mask = self.mask(filt)
+        if self.quantization is None:
+            distances = self.sq_norms - 2 * (self.vectors @ query) + query @ query
+            return self._top(self._pool(distances), k, mask)
+
+        if self.quantization == "int8":
+            approximate = self._int8_distances(query[None, :])[0]
+        else:
+            approximate = self._hamming_distances(query)
+        shortlist = self._top(self._pool(approximate), k * self.rerank, mask)
+        return self._rerank(query, shortlist, k)
+
+    def search_batch(self, queries, k, filt=None):
+        """search() for each row of `queries`.
+
+        Each pass scores QUERY_BLOCK queries against the index with one matrix
+        product, so the vectors are read once per block instead of once per
+        query.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        mask = self.mask(filt)
+        results = []
+        for start in range(0, len(queries), QUERY_BLOCK):
+            block = queries[start : start + QUERY_BLOCK]
+            if self.quantization is None:
+                distances = (
+                    self.sq_norms
+                    - 2 * (block @ self.vectors.T)
+                    + np.einsum("ij,ij->i", block, block)[:, None]
+                )
+                results.extend(self._top(d, k, mask) for d in self._pool(distances))
+                continue
+            if self.quantization == "int8":
+                approximate = self._int8_distances(block)
+            else:
+                approximate = np.stack([self._hamming_distances(q) for q in block])
+            for query, distances in zip(block, self._pool(approximate)):
+                shortlist = self._top(distances, k * self.rerank, mask)
+                results.append(self._rerank(query, shortlist, k))
+        return results
+
+    def _rerank(self, query, shortlist, k):
+        candidates = np.array([row for row, _ in shortlist], dtype=np.int64)
+        exact = self._exact_distances(query, candidates)
+        best = np.argsort(exact, kind="stable")[:k]
+        return [(int(candidates[i]), float(exact[i])) for i in best]
+
+    def _pool(self, distances):
+        if self.chunk_offsets is None:
+            return distances
+        # A project is as close as its closest chunk
+        return np.minimum.reduceat(distances, self.chunk_offsets[:-1], axis=-1)
+
+    @staticmethod
+    def _top(distances, k, mask):
+        if mask is not None:
+            distances = np.where(mask, distances, np.inf)
+        k = min(k, len(distances))
+        if k <= 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            (int(row), float(distances[row]))
+            for row in top
+            if distances[row] < np.inf
+        ]
+
+    def _int8_distances(self, queries):
+        """(queries, rows) approximate distances for a (queries, dim) array."""
+        dots = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK):
+            block = self.codes[start : start + SCAN_BLOCK]
+            dots[:, start : start + len(block)] = queries @ block.astype(np.float32).T
+        sq_queries = np.einsum("ij,ij->i", queries, queries)[:, None]
+        return self.sq_norms - 2 * dots * self.scales + sq_queries
+
+    def _hamming_distances(self, query):
+        return _popcount(self.bits ^ quantize_binary(query[None, :])).sum(
+            axis=1, dtype=np.int32
+        )
+
+    def _vector_rows(self, projects):
+        """(vector rows, chunks per project) of the given project rows."""
+        if self.chunk_offsets is None:
+            return projects, None
+        starts = self.chunk_offsets[projects]
+        lengths = self.chunk_offsets[projects + 1] - starts
+        rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return rows + np.arange(lengths.sum()), lengths
+
+    def _exact_distances(self, query, projects):
+        """Exact distances of the given project rows, from the float vectors."""
+        rows, lengths = self._vector_rows(projects)
+        if not len(rows):
+            return np.array([], dtype=np.float32)
+        # Gather in file order so reads from the mapped file stay sequential
+        order = np.argsort(rows, kind="stable")
+        rows_sorted = rows[order]
+        distances = np.empty(len(rows), dtype=np.float32)
+        distances[order] = (
+            self.sq_norms[rows_sorted]
+            - 2 * (self.vectors[rows_sorted] @ query)
+            + query @ query
+        )
+        if self.chunk_offsets is None:
+            return distances
+        return np.minimum.reduceat(distances, np.cumsum(lengths) - lengths)
+
+    def rows(self, uids):
+        """Project rows of the given ids, which must all be in the index."""
+        keys = np.array([uid.encode() for uid in uids], dtype="S36")
+        rows = np.searchsorted(self.ids, keys)
+        if (rows >= len(self.ids)).any() or (self.ids[rows] != keys).any():
+            raise KeyError("project ids not in the index")
+        return rows
+
+    def project_vectors(self, projects):
+        """One unit vector per project row, chunk vectors averaged."""
+        rows, lengths = self._vector_rows(np.asarray(projects, dtype=np.int64))
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if lengths is not None and len(rows):
+            vectors = np.add.reduceat(vectors, np.cumsum(lengths) - lengths, axis=0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def metadata(self, row):
+        return {"id": self.ids[row].decode(), "award": AWARDS[self.awards[row]]}
+
+
+if __name__ == "__main__":
+    import similar_to_others
+
+    snapshot = similar_to_others.current()
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else snapshot.mmap_dir
+    export_from_chroma(snapshot.db, snapshot.projects, out_dir)
+    print(f"Wrote snapshot of {len(snapshot.projects)} projects to {out_dir}")
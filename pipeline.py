@@ -0,0 +1,293 @@
+"""
+Runs the data pipeline, skipping every stage whose result is up to date.
+
+    find_projects -> scrape -> dedup -> classify -> index -> triplets
+
+Each stage is a script with declared input and output files; a stage
+depends on the stages that write its inputs. Before running a stage its
+fingerprint is computed from:
+
+  - the content of its input files
+  - the source of its script and every repo module it imports, transitively
+  - the values of the environment variables that code reads (secrets, named
+    *KEY*, *TOKEN* or *SECRET*, are left out)
+
+If the fingerprint matches the last successful run and the outputs are
+unchanged since, the stage is skipped. Because fingerprints hash content,
+a stage that re-runs but writes identical outputs does not invalidate the
+stages after it. Stages whose dependencies are done run in parallel.
+
+File hashes are cached by size and mtime in output/.pipeline.json, along
+with the state of each stage, so a no-op run reads no large files.
+
+    python pipeline.py                  # everything
+    python pipeline.py classify         # classify and what it depends on
+    python pipeline.py --skip find_projects scrape    # use the existing scrape
+    python pipeline.py --force dedup    # re-run dedup (and whatever changes)
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(ROOT, "output", ".pipeline.json")
+
+_getenv = re.compile(r"""(?:getenv|environ\.get|environ\[)\(?\s*["'](\w+)["']""")
+_secret = re.compile(r"KEY|TOKEN|SECRET")
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+
+
+STAGES = [
+    Stage(
+        "find_projects",
+        "scrape/devpost_find_projects.py",
+        outputs=["output/devpost_projects_bigredhacks_penapp.jsonl"],
+    ),
+    Stage(
+        "scrape",
+        "scrape/devpost_scrape_many.py",
+        inputs=["output/devpost_projects_bigredhacks_penapp.jsonl"],
+        outputs=["output/projects_parsed.jsonl"],
+    ),
+    Stage(
+        "dedup",
+        "build_data/dedup_projects.py",
+        inputs=["output/projects_parsed.jsonl"],
+        outputs=["output/corpus.parquet"],
+    ),
+    Stage(
+        "classify",
+        "build_data/classify_prizes.py",
+        inputs=["output/corpus.parquet"],
+        outputs=["output/awards_mapping.json", "output/corpus.award.parquet"],
+    ),
+    Stage(
+        "index",
+        "build_vector_db.py",
+        inputs=["output/corpus.parquet", "output/corpus.award.parquet"],
+        outputs=[
+            "output/project_id_to_data.json",
+            "output/corpus.embedding.parquet",
+            "snapshots/CURRENT",
+        ],
+    ),
+    Stage(
+        "triplets",
+        "build_data/build_triplets_parallel.py",
+        inputs=[
+            "output/corpus.parquet",
+            "output/corpus.award.parquet",
+            "snapshots/CURRENT",
+        ],
+        outputs=["output/triplets/manifest.json"],
+    ),
+]
+
+
+def dependencies(stages):
+    writers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {
+        stage.name: {writers[p] for p in stage.inputs if p in writers}
+        for stage in stages
+    }
+
+
+def module_path(name):
+    base = os.path.join(ROOT, *name.split("."))
+    for path in (base + ".py", os.path.join(base, "__init__.py")):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def code_files(script):
+    """The script and every repo module it imports, transitively."""
+    seen, todo = set(), [os.path.join(ROOT, script)]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+                names += [f"{node.module}.{alias.name}" for alias in node.names]
+            else:
+                continue
+            todo.extend(p for p in map(module_path, names) if p)
+    return sorted(seen)
+
+
+class Hasher:
+    """Content hashes of files, cached by size and mtime between runs."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, path):
+        full = os.path.join(ROOT, path)
+        if not os.path.exists(full):
+            return None
+        stat = os.stat(full)
+        key = [stat.st_size, stat.st_mtime_ns]
+        cached = self.cache.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(full, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.cache[path] = key + [digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def fingerprint(stage, hash_file):
+    code = code_files(stage.script)
+    env = set()
+    for path in code:
+        with open(path, encoding="utf-8") as f:
+            env.update(_getenv.findall(f.read()))
+    code = [os.path.relpath(path, ROOT) for path in code]
+    parts = {
+        "inputs": {path: hash_file(path) for path in stage.inputs},
+        "code": {path: hash_file(path) for path in code},
+        "env": {name: os.getenv(name) for name in env if not _secret.search(name)},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def load_state():
+    if not os.path.exists(STATE_PATH):
+        return {"stages": {}, "files": {}}
+    with open(STATE_PATH) as f:
+        return json.load(f)
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, STATE_PATH)
+
+
+def up_to_date(stage, recorded, current, hash_file):
+    if not recorded or recorded["fingerprint"] != current:
+        return False
+    return all(hash_file(p) == recorded["outputs"].get(p) for p in stage.outputs)
+
+
+def run_stage(stage):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, stage.script], cwd=ROOT, env=env)
+    return result.returncode, time.perf_counter() - start
+
+
+def selected(targets, deps):
+    """The targets and everything they depend on, in pipeline order."""
+    wanted, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(deps[name])
+    return [stage for stage in STAGES if stage.name in wanted]
+
+
+def main():
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("targets", nargs="*", help=f"Any of {', '.join(names)}")
+    parser.add_argument(
+        "--force", nargs="+", default=[], choices=names, help="Run even if up to date"
+    )
+    parser.add_argument(
+        "--skip",
+        nargs="+",
+        default=[],
+        choices=names,
+        help="Treat as done and use their existing outputs",
+    )
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(names)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    deps = dependencies(STAGES)
+    stages = selected(args.targets or names, deps)
+    state = load_state()
+    hash_file = Hasher(state["files"])
+    done, failed, running = set(args.skip), set(), {}
+
+    with ThreadPoolExecutor(args.jobs) as pool:
+        while True:
+            # After a failure, let running stages finish but start no more
+            for stage in stages if not failed else []:
+                name = stage.name
+                if name in done or name in running or name in failed:
+                    continue
+                if not deps[name] <= done:
+                    continue
+                current = fingerprint(stage, hash_file)
+                recorded = state["stages"].get(name)
+                if name not in args.force and up_to_date(
+                    stage, recorded, current, hash_file
+                ):
+                    print(f"[pipeline] {name}: up to date")
+                    done.add(name)
+                    continue
+                print(f"[pipeline] {name}: running {stage.script}")
+                running[name] = (pool.submit(run_stage, stage), current)
+            save_state(state)
+            if not running:
+                break
+            finished, _ = wait(
+                [future for future, _ in running.values()], return_when=FIRST_COMPLETED
+            )
+            for name, (future, current) in list(running.items()):
+                if future not in finished:
+                    continue
+                del running[name]
+                code, elapsed = future.result()
+                stage = next(s for s in STAGES if s.name == name)
+                missing = [p for p in stage.outputs if hash_file(p) is None]
+                if code or missing:
+                    reason = f"exit code {code}" if code else f"no {', '.join(missing)}"
+                    print(f"[pipeline] {name}: failed with {reason}")
+                    failed.add(name)
+                    continue
+                print(f"[pipeline] {name}: done in {elapsed:.1f}s")
+                state["stages"][name] = {
+                    "fingerprint": current,
+                    "outputs": {p: hash_file(p) for p in stage.outputs},
+                }
+                done.add(name)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Fits reference writeups into a fixed prompt token budget.
+
+Prompts that paste whole writeups vary from a few hundred tokens to more
+than the model's context. Here tokens are counted locally, the budget is
+split across the references and each reference that does not fit its share
+is cut down section by section:
+
+  - allocate() gives every reference an equal share; whatever a short
+    reference leaves unused is shared among the longer ones
+  - compress() always keeps a writeup's opening section and then adds the
+    other sections while they fit: in order of how many of the query's
+    terms they contain when there is a query, in document order otherwise.
+    The first section that did not fit is truncated into what is left.
+    Kept sections stay in their original order
+
+Without a query the result depends only on the texts and the budget, so
+the same references always compress to the same text.
+
+Tokens are counted with tiktoken when it is installed and its encoding can
+be loaded, and estimated at CHARS_PER_TOKEN characters per token otherwise.
+"""
+import math
+from functools import lru_cache
+
+import chunking
+import lexical
+
+ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4
+# Smaller leftovers are not worth a truncated section
+MIN_SECTION_TOKENS = 50
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(ENCODING)
+    except Exception:
+        # Not installed, or the encoding file could not be downloaded
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate(text, max_tokens):
+    """The longest prefix of text with at most max_tokens tokens."""
+    max_tokens = max(0, max_tokens)
+    encoding = _encoding()
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def allocate(sizes, budget):
+    """Token allowance per item; no item gets more than its size."""
+    shares = [0] * len(sizes)
+    remaining = max(0, budget)
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for position, i in enumerate(order):
+        shares[i] = min(sizes[i], remaining // (len(sizes) - position))
+        remaining -= shares[i]
+    return shares
+
+
+def compress(markdown, budget, query_terms=frozenset()):
+    """The sections of markdown most relevant to query_terms (the first ones
+    when there are none), in at most budget tokens."""
+    if count_tokens(markdown) <= budget:
+        return markdown
+    sections = chunking.sections(markdown)
+    if not sections:
+        return truncate(markdown, budget)
+    head, rest = sections[0], sections[1:]
+    used = count_tokens(head)
+    if used >= budget:
+        return truncate(head, budget)
+
+    def relevance(section):
+        terms = set(lexical.tokenize(section))
+        return len(terms & query_terms) / math.sqrt(len(terms) + 1)
+
+    kept, cut = {}, None
+    for i in sorted(range(len(rest)), key=lambda i: relevance(rest[i]), reverse=True):
+        cost = count_tokens(rest[i]) + 1
+        if used + cost <= budget:
+            kept[i] = rest[i]
+            used += cost
+        elif cut is None:
+            cut = i
+    # The first section passed over fills what is left
+    if cut is not None and budget - used > MIN_SECTION_TOKENS:
+        kept[cut] = truncate(rest[cut], budget - used - 1)
+    return "\n\n".join([head] + [kept[i] for i in sorted(kept)])
+
+
+def fit(texts, budget, query=None):
+    """texts, each compressed (towards query, if given) so that together they
+    fit budget."""
+    query_terms = set(lexical.tokenize(query)) if query else frozenset()
+    sizes = [count_tokens(text) for text in texts]
+    shares = allocate(sizes, budget)
+    return [compress(text, share, query_terms) for text, share in zip(texts, shares)]
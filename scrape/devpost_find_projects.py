@@ -1,4 +1,5 @@
-import requests
+import os
+import httpx
 from urllib.parse import urlparse
 
 from tqdm import tqdm
@@ -6,8 +7,11 @@ from bs4 import BeautifulSoup
 import time
 import json
 from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
+import upstream
+
 
 class DevPostScraper:
     def __init__(
@@ -16,13 +20,9 @@ class DevPostScraper:
         output_file="output/devpost_projects.jsonl",
     ):
         self.base_url = base_url
-        self.session = requests.Session()
-        # Add headers to mimic a browser
-        self.session.headers.update(
-            {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-        )
+        # Pages are fetched through the shared Devpost client, which sends
+        # browser-like headers and keeps connections alive between pages
+        self.client = upstream.devpost
         self.output_file = output_file
 
     def get_page_content(self, page: int = 1) -> Optional[BeautifulSoup]:
@@ -30,10 +30,10 @@ class DevPostScraper:
         Fetch the content of a specific page
         """
         try:
-            response = self.session.get(f"{self.base_url}?page={page}")
+            response = self.client.get(f"{self.base_url}?page={page}")
             response.raise_for_status()
             return BeautifulSoup(response.content, "html.parser")
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error fetching page {page}: {e}")
             return None
 
@@ -122,6 +122,7 @@ class DevPostScraper:
             else:
                 soup = self.get_page_content(current_page)
                 if not soup:
+                    current_page += 1
                     continue
             # Find all project elements on the page
             project_elements = soup.find_all("div", class_="software-entry")
@@ -137,6 +138,27 @@ class DevPostScraper:
             # time.sleep(2)  # Be nice to the server
         return all_projects
 
+    def fetch_projects(self) -> List[Dict]:
+        """
+        All projects in the gallery, in gallery order, without saving them.
+        Pages after the first are fetched concurrently.
+        """
+        first_page = self.get_page_content(1)
+        if not first_page:
+            return []
+        total_pages = self.get_total_pages(first_page)
+        with ThreadPoolExecutor(max_workers=self.client.concurrency) as pool:
+            pages = [first_page] + list(
+                pool.map(self.get_page_content, range(2, total_pages + 1))
+            )
+        projects = []
+        for soup in filter(None, pages):
+            for element in soup.find_all("div", class_="software-entry"):
+                project_data = self.parse_project(element)
+                if project_data:
+                    projects.append(project_data)
+        return projects
+
     def save_to_jsonl(
         self,
         projects: List[Dict],
@@ -299,12 +321,17 @@ https://pennapps2014s.devpost.com/?ref_feature=challenge&ref_medium=discover
 https://pennapps-xxiii.devpost.com/?ref_feature=challenge&ref_medium=discover
 """.strip().split()
 
+    # Every gallery appends to a fresh temporary file that then replaces the
+    # output, so a re-run (or an interrupted one) never duplicates projects
+    tmp_file = output_file + ".tmp"
+    open(tmp_file, "w").close()
     for hackathon in tqdm(hackathons):
         domain = urlparse(hackathon).netloc
         scraper = DevPostScraper(
-            base_url=f"https://{domain}/project-gallery", output_file=output_file
+            base_url=f"https://{domain}/project-gallery", output_file=tmp_file
         )
         scraper.scrape_projects()
+    os.replace(tmp_file, output_file)
 
 
 if __name__ == "__main__":
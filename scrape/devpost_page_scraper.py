@@ -1,4 +1,4 @@
-import requests
+import httpx
 import re
 from bs4 import BeautifulSoup
 import json
@@ -6,26 +6,34 @@ import time
 import logging
 from markdownify import markdownify as md
 
+import upstream
+
 class DevpostScraper:
     def __init__(self, proxy=None):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         self.proxy = proxy
         
-        # Format proxy dictionary if proxy is provided
-        self.proxies = None
+        # Requests share the pooled Devpost client unless a proxy is given,
+        # which needs a client of its own
+        self.client = None
         if self.proxy:
             if not self.proxy.startswith(('http://', 'https://')):
                 self.proxy = 'http://' + self.proxy
-            self.proxies = {
-                'http': self.proxy,
-                'https': self.proxy
-            }
+            self.client = httpx.Client(
+                proxy=self.proxy,
+                headers=upstream.devpost.headers,
+                timeout=upstream.devpost.timeout,
+                follow_redirects=True,
+            )
             self.logger.info(f"Using proxy: {self.proxy}")
 
+    def fetch(self, url):
+        if self.client is None:
+            return upstream.devpost.get(url)
+        with upstream.devpost.slot():
+            return self.client.get(url)
+
     def clean_markdown(self, content):
         """Clean up markdown content by removing excessive newlines"""
         # Replace 3 or more newlines with 2 newlines
@@ -53,13 +61,7 @@ class DevpostScraper:
 
     def scrape_submission(self, url):
         try:
-            # Add timeout and proxy configuration
-            response = requests.get(
-                url,
-                headers=self.headers,
-                proxies=self.proxies,
-                timeout=30  # Add timeout to prevent hanging
-            )
+            response = self.fetch(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.text, 'html.parser')
             
@@ -111,7 +113,7 @@ class DevpostScraper:
             
             return data
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             self.logger.error(f"Request error scraping {url}: {str(e)}")
             return None
         except Exception as e:
@@ -1,26 +1,522 @@
-from langchain_cohere import CohereEmbeddings
-from langchain_community.vectorstores import Chroma
-
 import dotenv
 
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+from types import SimpleNamespace
+
+import numpy as np
+import orjson
+
+import chunking
+import lexical
+import metrics
+import upstream
+from metrics import span
 
 dotenv.load_dotenv()
 
 api_key = os.getenv("COHERE_API_KEY")
 api_key_prod = os.getenv("COHERE_API_KEY_PROD")
+base_url = os.getenv("COHERE_BASE_URL", "https://stg.api.cohere.com/")
 
-embeddings = CohereEmbeddings(
-    cohere_api_key=api_key,
-    base_url="https://stg.api.cohere.com/",
-    model="embed-english-v3.0",
-)
+# "chroma" queries the Chroma db directly. "mmap" serves from the read-only
+# snapshot written by mmap_store.py, which every worker process shares.
+backend = os.getenv("FLIGHTDECK_INDEX", "chroma")
+# With the mmap backend, "int8" or "binary" scans a quantized copy of the
+# vectors and re-ranks the best candidates exactly (see mmap_store.py)
+quantization = os.getenv("FLIGHTDECK_QUANTIZATION", "none")
+
+# "vector" ranks by embedding distance alone, "hybrid" fuses it with the local
+# BM25 index (see lexical.py) and "lexical" never calls the embedder. In the
+# first two, a query whose embedding fails or takes longer than
+# embed_deadline seconds is answered from the BM25 index instead.
+retrieval = os.getenv("FLIGHTDECK_RETRIEVAL", "vector")
+embed_deadline = float(os.getenv("FLIGHTDECK_EMBED_DEADLINE", "5"))
+
+# Each ranked list contributes weight / (RRF_K + rank) to a project's score
+RRF_K = 60
+# How many candidates each ranker contributes per requested result
+HYBRID_CANDIDATES = 4
+# Chunks fetched from Chroma per requested project when the index is chunked
+CHUNK_CANDIDATES = 8
+# Results fetched per requested result before a diversity (MMR) re-rank
+MMR_CANDIDATES = 4
+
+# build_vector_db.py writes each build to snapshots/<version>/ and then points
+# snapshots/CURRENT at it. Without a CURRENT file the unversioned layout below
+# is used.
+snapshots_dir = "./snapshots"
+current_file = os.path.join(snapshots_dir, "CURRENT")
 
 persist_dir = "./chroma_langchain_db"
-print("loading db")
-db = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
-print("done loading db")
+snapshot_dir = "./index_snapshot"
+projects_file = "output/project_id_to_data.json"
+
+EMBED_MODEL = "embed-english-v3.0"
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    import cohere
+    from langchain_cohere import CohereEmbeddings
+
+    embeddings = CohereEmbeddings(
+        cohere_api_key=api_key,
+        base_url=base_url,
+        model=EMBED_MODEL,
+        request_timeout=upstream.cohere.timeout,
+    )
+    # Send requests through the shared pool rather than the SDK's own client
+    embeddings.client = cohere.Client(
+        api_key,
+        base_url=base_url,
+        timeout=upstream.cohere.timeout,
+        httpx_client=upstream.cohere.client(),
+    )
+    return embeddings
+
+
+_embed_pool = ThreadPoolExecutor(
+    max_workers=upstream.cohere.concurrency, thread_name_prefix="embed"
+)
+
+
+def embed_query(doc):
+    """One query vector for doc.
+
+    A document longer than a chunk is embedded section by section in a single
+    request and the normalized vectors are averaged, so nothing past the
+    embedder's input limit is dropped and search still takes one vector.
+    """
+    chunks = chunking.chunk(doc)
+    if len(chunks) == 1:
+        return get_embeddings().embed_query(doc)
+    vectors = np.array(get_embeddings().embed(chunks, input_type="search_query"))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    mean = vectors.mean(axis=0)
+    return (mean / np.linalg.norm(mean)).tolist()
+
+
+EMBED_BATCH = 96
+
+
+def embed_texts(texts, input_type):
+    """Embeds texts with one request to the embed endpoint.
+
+    This skips the SDK, which builds a model object for every float in the
+    response and so spends more CPU than the request takes on big batches.
+    """
+    response = upstream.cohere.post(
+        base_url.rstrip("/") + "/v1/embed",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        },
+        content=orjson.dumps(
+            {
+                "texts": texts,
+                "model": EMBED_MODEL,
+                "input_type": input_type,
+                "embedding_types": ["float"],
+            }
+        ),
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)["embeddings"]["float"]
+
+
+def embed_batch(docs, input_type="search_query"):
+    """One unit vector per document, for many documents at once.
+
+    Every chunk of every document goes out in requests of up to EMBED_BATCH
+    texts, sent in parallel, and each document's chunk vectors are averaged
+    as in embed_query. Pass input_type="search_document" to embed documents
+    the way the index's own projects were.
+
+    Blank documents are not sent (the embedder rejects empty text); their
+    vector is all zeros.
+    """
+    present = [i for i, doc in enumerate(docs) if doc.strip()]
+    chunks = [chunking.chunk(docs[i]) for i in present]
+    texts = [text for parts in chunks for text in parts]
+    batches = [texts[i : i + EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+    vectors = np.array(
+        [
+            v
+            for part in _embed_pool.map(embed_texts, batches, [input_type] * len(batches))
+            for v in part
+        ],
+        dtype=np.float32,
+    )
+    pooled = np.zeros((len(docs), vectors.shape[1] if len(vectors) else 0), np.float32)
+    if not present:
+        return pooled
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    starts = np.cumsum([0] + [len(parts) for parts in chunks[:-1]])
+    pooled[present] = np.add.reduceat(vectors, starts, axis=0)
+    return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+
+def _embed(doc):
+    with upstream.cohere.slot():
+        return embed_query(doc)
+
+
+def embed_with_deadline(doc):
+    """The query embedding, or None if the embedder fails or is too slow."""
+    future = _embed_pool.submit(_embed, doc)
+    try:
+        return future.result(timeout=embed_deadline)
+    except TimeoutError:
+        metrics.retrieval_fallback.inc(reason="embed_timeout")
+    except Exception as e:
+        print(f"embedding failed, falling back to lexical search: {e!r}")
+        metrics.retrieval_fallback.inc(reason="embed_error")
+    return None
+
+
+def mmr(relevance, vectors, k, diversity):
+    """Indices of k candidates picked greedily by maximal marginal relevance.
+
+    Each pick maximizes (1 - diversity) * relevance minus diversity times the
+    candidate's highest cosine similarity to the picks so far, so with
+    diversity 0 this is the relevance order and higher values push out near
+    repeats. vectors are the candidates' unit vectors; their similarity
+    matrix is computed once and each pick is one vectorized step.
+    """
+    similarity = vectors @ vectors.T
+    closest = np.full(len(relevance), -1.0, dtype=np.float32)
+    available = np.ones(len(relevance), dtype=bool)
+    picked = []
+    for _ in range(min(k, len(relevance))):
+        gain = (1 - diversity) * relevance - diversity * closest
+        pick = int(np.argmax(np.where(available, gain, -np.inf)))
+        picked.append(pick)
+        available[pick] = False
+        closest = np.maximum(closest, similarity[pick])
+    return picked
+
+
+def similarity(distance):
+    """Cosine similarity of two unit vectors from their squared L2 distance."""
+    return 1.0 - float(distance) / 2
+
+
+def snapshot_paths(version):
+    """(chroma dir, mmap snapshot dir, projects file) for a published version."""
+    if version is None:
+        return persist_dir, snapshot_dir, projects_file
+    root = os.path.join(snapshots_dir, version)
+    return (
+        os.path.join(root, "chroma_langchain_db"),
+        os.path.join(root, "index_snapshot"),
+        os.path.join(root, "project_id_to_data.json"),
+    )
+
+
+class Snapshot:
+    """One immutable version of the vector index and the project data.
+
+    Requests hold on to the Snapshot they started with, so swapping in a new
+    one never changes the data under a request that is already running.
+    """
+
+    def __init__(self, version=None):
+        self.version = version or "unversioned"
+        self.chroma_dir, self.mmap_dir, self.projects_file = snapshot_paths(version)
+        if version is None:
+            version_file = os.path.join(persist_dir, "index_version")
+            if os.path.exists(version_file):
+                with open(version_file, "r") as f:
+                    self.version = f.read().strip()
+
+        # LangChain, Chroma and Cohere are slow to import, so they are only
+        # touched here, never at module import.
+        self._blobs = {}
+        # The mmap index; with Chroma only loaded alongside the BM25 index
+        self.index = None
+        if backend == "mmap":
+            from mmap_store import MmapIndex, ProjectStore
+
+            self.projects = ProjectStore(self.mmap_dir)
+            self.index = MmapIndex(
+                self.mmap_dir, None if quantization == "none" else quantization
+            )
+            get_embeddings()
+        else:
+            from langchain_community.vectorstores import Chroma
+
+            with open(self.projects_file, "rb") as f:
+                self.projects = orjson.loads(f.read())
+            print(f"loading db {self.version}")
+            self.db = Chroma(
+                persist_directory=self.chroma_dir,
+                embedding_function=get_embeddings(),
+            )
+            print("done loading db")
+
+        # Chunked builds store several vectors per project, see chunking.py
+        self.chunked = os.path.exists(
+            os.path.join(self.mmap_dir, "chunk_offsets.npy")
+        )
+
+        # Snapshots built before the BM25 index existed are served vector-only
+        self.lexical = None
+        if lexical.exists(self.mmap_dir):
+            from mmap_store import MmapIndex
+
+            self.lexical = lexical.LexicalIndex(self.mmap_dir)
+            if backend != "mmap":
+                # Only for its id and award columns, to map lexical rows
+                self.index = MmapIndex(self.mmap_dir)
+
+        # Local win scoring, for snapshots with an mmap copy of the vectors
+        self.scorer = None
+        if os.path.exists(os.path.join(self.mmap_dir, "vectors.npy")):
+            import did_it_win_big
+
+            self.scorer = did_it_win_big.WinScorer(self.mmap_dir)
+
+    def warm(self):
+        """Pulls the index into memory so the first request after a swap is fast."""
+        if backend == "mmap":
+            self.index.warm()
+        else:
+            self.db.get(limit=1)
+
+    def search(self, doc, k, filt=None, diversity=None):
+        """Returns (results, mode).
+
+        results are (document, score) pairs, best first; in every mode a
+        higher score is better. mode says how they were ranked: "vector"
+        (score is cosine similarity), "hybrid" (reciprocal rank fusion score),
+        "lexical" (BM25 score) or "fallback" (BM25 because the embedder failed
+        or missed its deadline).
+
+        With a diversity between 0 and 1, MMR_CANDIDATES times as many results
+        are fetched and k of them picked by maximal marginal relevance, see
+        diversify().
+        """
+        if diversity and self.index is not None:
+            results, mode, query = self._search(doc, k * MMR_CANDIDATES, filt)
+            return self.diversify(results, query, k, diversity), mode
+        return self._search(doc, k, filt)[:2]
+
+    def _search(self, doc, k, filt):
+        """(results, mode, query vector or None if none was embedded)."""
+        if self.lexical is None:
+            with upstream.cohere.slot(), span("embed"):
+                query = embed_query(doc)
+            return self.vector_search(query, k, filt), "vector", query
+        if retrieval == "lexical":
+            return self.lexical_search(doc, k, filt), "lexical", None
+
+        with span("embed"):
+            query = embed_with_deadline(doc)
+        if query is None:
+            return self.lexical_search(doc, k, filt), "fallback", None
+        if retrieval == "hybrid":
+            return self.hybrid_search(doc, query, k, filt), "hybrid", query
+        return self.vector_search(query, k, filt), "vector", query
+
+    def get_similar(self, doc, k, filt=None, diversity=None):
+        return self.search(doc, k, filt, diversity)[0]
+
+    def diversify(self, results, query, k, diversity):
+        """The k results chosen by maximal marginal relevance (see mmr), using
+        the projects' stored vectors; nothing is re-embedded.
+
+        Relevance is cosine similarity to the query, or the result order when
+        the query was not embedded.
+        """
+        if len(results) <= k:
+            return results
+        with span("mmr"):
+            rows = self.index.rows([res.metadata["id"] for res, _ in results])
+            vectors = self.index.project_vectors(rows)
+            if query is None:
+                relevance = np.linspace(1, 0, len(results))
+            else:
+                relevance = vectors @ np.asarray(query, dtype=np.float32)
+            return [results[i] for i in mmr(relevance, vectors, k, diversity)]
+
+    def search_batch(self, docs, k, filt=None):
+        """search() for many documents: [(results, mode)], one per document.
+
+        The documents are embedded together (see embed_batch) and, with the
+        mmap index, searched with one matrix product per block of queries.
+        If embedding fails they are answered from the BM25 index.
+        """
+        if retrieval == "lexical" and self.lexical is not None:
+            return [(self.lexical_search(doc, k, filt), "lexical") for doc in docs]
+        try:
+            with span("embed"):
+                queries = embed_batch(docs)
+        except Exception as e:
+            if self.lexical is None:
+                raise
+            print(f"embedding failed, falling back to lexical search: {e!r}")
+            metrics.retrieval_fallback.inc(reason="embed_error")
+            return [(self.lexical_search(doc, k, filt), "fallback") for doc in docs]
+
+        hybrid = retrieval == "hybrid" and self.lexical is not None
+        candidates = k * HYBRID_CANDIDATES if hybrid else k
+        if backend == "mmap":
+            with span("vector_search"):
+                dense = [
+                    [
+                        (
+                            SimpleNamespace(metadata=self.index.metadata(row)),
+                            similarity(distance),
+                        )
+                        for row, distance in found
+                    ]
+                    for found in self.index.search_batch(queries, candidates, filt)
+                ]
+        else:
+            dense = [self.vector_search(q.tolist(), candidates, filt) for q in queries]
+        if not hybrid:
+            return [(results, "vector") for results in dense]
+        return [
+            (self.fuse(results, self.lexical_search(doc, candidates, filt), k), "hybrid")
+            for doc, results in zip(docs, dense)
+        ]
+
+    def lexical_search(self, doc, k, filt=None):
+        with span("lexical_search"):
+            return [
+                (SimpleNamespace(metadata=self.index.metadata(row)), score)
+                for row, score in self.lexical.search(doc, k, self.index.mask(filt))
+            ]
+
+    def hybrid_search(self, doc, query, k, filt=None):
+        candidates = k * HYBRID_CANDIDATES
+        dense = self.vector_search(query, candidates, filt)
+        sparse = self.lexical_search(doc, candidates, filt)
+        return self.fuse(dense, sparse, k)
+
+    @staticmethod
+    def fuse(dense, sparse, k):
+        with span("fusion"):
+            fused, metadata = {}, {}
+            for ranked in (dense, sparse):
+                for rank, (res, _) in enumerate(ranked):
+                    uid = res.metadata["id"]
+                    metadata.setdefault(uid, res.metadata)
+                    fused[uid] = fused.get(uid, 0.0) + 1.0 / (RRF_K + rank + 1)
+            best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [(SimpleNamespace(metadata=metadata[uid]), fused[uid]) for uid in best]
+
+    def vector_search(self, query, k, filt=None):
+        """[(document, cosine similarity)], closest first.
+
+        Both backends give squared L2 distances, which are converted so that,
+        as in the other modes, a higher score is better.
+        """
+        with span("vector_search"):
+            if backend == "mmap":
+                return [
+                    (
+                        SimpleNamespace(metadata=self.index.metadata(row)),
+                        similarity(distance),
+                    )
+                    for row, distance in self.index.search(query, k, filt)
+                ]
+            if not self.chunked:
+                found = self.db.similarity_search_by_vector_with_relevance_scores(
+                    query, k=k, filter=filt
+                )
+                return [(doc, similarity(distance)) for doc, distance in found]
+            chunks = self.db.similarity_search_by_vector_with_relevance_scores(
+                query, k=k * CHUNK_CANDIDATES, filter=filt
+            )
+        with span("chunk_pooling"):
+            # Results come closest first, so each project's first chunk is its
+            # best one
+            ids = np.array([doc.metadata["id"] for doc, _ in chunks])
+            _, first = np.unique(ids, return_index=True)
+            return [
+                (chunks[i][0], similarity(chunks[i][1])) for i in np.sort(first)[:k]
+            ]
+
+    def project_json(self, uid):
+        """The project record as JSON bytes, encoded at most once."""
+        if backend == "mmap":
+            return self.projects.blob(uid)
+        blob = self._blobs.get(uid)
+        if blob is None:
+            blob = self._blobs[uid] = orjson.dumps(self.projects[uid])
+        return blob
+
+
+_current = None
+_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+
+def published_version():
+    """The version snapshots/CURRENT points at, or None."""
+    try:
+        with open(current_file, "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current():
+    global _current
+    if _current is None:
+        with _lock:
+            if _current is None:
+                _current = Snapshot(published_version())
+    return _current
+
+
+def reload():
+    """Loads the published snapshot and swaps it in if it is new.
+
+    The new snapshot is fully loaded and warmed before the swap; requests
+    already running keep using the old one until they finish.
+    """
+    global _current
+    with _reload_lock:
+        version = published_version()
+        if version is None or (_current is not None and _current.version == version):
+            return current().version
+        snapshot = Snapshot(version)
+        snapshot.warm()
+        with _lock:
+            _current = snapshot
+        return snapshot.version
+
+
+def publish(version, keep=3):
+    """Atomically points CURRENT at snapshots/<version> and prunes old builds."""
+    tmp = current_file + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, current_file)
+
+    versions = sorted(
+        v
+        for v in os.listdir(snapshots_dir)
+        if os.path.isdir(os.path.join(snapshots_dir, v))
+    )
+    for old in versions[:-keep]:
+        if old != version:
+            shutil.rmtree(os.path.join(snapshots_dir, old), ignore_errors=True)
+
+
+def warm_up():
+    current().warm()
+
 
 def get_similar(doc, k, filt=None):
-    results = db.similarity_search_with_score(doc, k=k, filter=filt)
-    return results
+    return current().get_similar(doc, k, filt)
+
+
+def index_version():
+    return current().version
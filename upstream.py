@@ -0,0 +1,134 @@
+"""
+Shared, pooled HTTP clients for the services the project calls.
+
+Creating a client per request pays TCP and TLS setup every time. Each
+Upstream instead keeps one sync and one async httpx client per process, with
+a keep-alive pool, HTTP/2 when the h2 package is installed and a default
+timeout. A per-upstream semaphore caps how many calls are in flight at once,
+so a burst queues locally instead of tripping the upstream's rate limits.
+
+Limits and timeouts can be overridden per upstream with
+FLIGHTDECK_<NAME>_CONCURRENCY and FLIGHTDECK_<NAME>_TIMEOUT.
+"""
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+)
+
+
+class Upstream:
+    def __init__(self, name, concurrency, timeout, headers=None):
+        prefix = f"FLIGHTDECK_{name.upper()}_"
+        self.name = name
+        self.concurrency = int(os.getenv(prefix + "CONCURRENCY", concurrency))
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", timeout))
+        self.headers = headers or {}
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Pools hold sockets, which must not be shared with a forked child
+        self._pid = os.getpid()
+        self._client = None
+        self._async_client = None
+        self._semaphore = threading.BoundedSemaphore(self.concurrency)
+        self._async_semaphore = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _client_kwargs(self):
+        return {
+            "http2": HTTP2,
+            "headers": self.headers,
+            "timeout": self.timeout,
+            "follow_redirects": True,
+            "limits": httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+        }
+
+    def client(self):
+        """The process-wide httpx.Client for this upstream; safe across threads."""
+        self._check_pid()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(**self._client_kwargs())
+        return self._client
+
+    def async_client(self):
+        """The process-wide httpx.AsyncClient, bound to the serving event loop."""
+        self._check_pid()
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_kwargs())
+        return self._async_client
+
+    @contextmanager
+    def slot(self):
+        """Holds one of this upstream's concurrency slots for a blocking call."""
+        self._check_pid()
+        with self._semaphore:
+            yield
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Holds one concurrency slot without blocking the event loop."""
+        self._check_pid()
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._async_semaphore:
+            yield
+
+    def get(self, url, **kwargs):
+        with self.slot():
+            return self.client().get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        with self.slot():
+            return self.client().post(url, **kwargs)
+
+    async def async_post(self, url, **kwargs):
+        async with self.async_slot():
+            return await self.async_client().post(url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+devpost = Upstream("devpost", 16, 30.0, headers={"User-Agent": USER_AGENT})
+ranker = Upstream("ranker", 8, 30.0)
+cohere = Upstream("cohere", 32, 60.0)
+# /arena asks for ten 4096-token completions in one call, which can take minutes
+openai = Upstream("openai", 16, 600.0)
+
+UPSTREAMS = [devpost, ranker, cohere, openai]
+
+
+async def aclose():
+    """Closes every pool; called when the API shuts down."""
+    for upstream in UPSTREAMS:
+        await upstream.aclose()